@@ -1,6 +1,7 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routers import wallet, send, swap, tx, auth
+from services.swap import close_jupiter_client
 
 app = FastAPI(title="Solana Wallet API", version="2.1.0", description="Wallet API for Solana blockchain with USDT support")
 
@@ -26,6 +27,10 @@ app.include_router(send.router)
 app.include_router(swap.router)
 app.include_router(tx.router)
 
+@app.on_event("shutdown")
+def shutdown_event():
+    close_jupiter_client()
+
 @app.get("/")
 def root():
     return {
@@ -1,5 +1,8 @@
+import time
+import random
 import base64
-import requests
+import httpx
+import orjson
 from typing import Optional, Dict, Any, List
 from decimal import Decimal, ROUND_DOWN, InvalidOperation
 from fastapi import HTTPException
@@ -18,6 +21,35 @@ from models.schemas import TokenRef
 JUPITER_API_URL = "https://quote-api.jup.ag/v6/quote"
 JUPITER_SWAP_URL = "https://quote-api.jup.ag/v6/swap"
 
+# Persistent HTTP/2 client so quote/swap calls multiplex over one keep-alive connection
+_jupiter_client = httpx.Client(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+    timeout=httpx.Timeout(30.0, connect=5.0),
+)
+
+def close_jupiter_client() -> None:
+    """Close pooled Jupiter connections (called on app shutdown)"""
+    _jupiter_client.close()
+
+JUPITER_MAX_RETRIES = 3
+
+def _jupiter_request(method: str, url: str, **kwargs) -> httpx.Response:
+    """Send a Jupiter API request, retrying 429/5xx with jittered exponential backoff"""
+    for attempt in range(JUPITER_MAX_RETRIES + 1):
+        response = _jupiter_client.request(method, url, **kwargs)
+        retryable = response.status_code == 429 or 500 <= response.status_code < 600
+        if not retryable or attempt == JUPITER_MAX_RETRIES:
+            return response
+        
+        retry_after = response.headers.get("Retry-After")
+        try:
+            delay = float(retry_after)
+        except (TypeError, ValueError):
+            delay = 2 ** attempt + random.random() * 0.3
+        time.sleep(min(delay, 8))
+    return response
+
 def _route_to_tokens_str(route: List[dict]) -> List[str]:
     """Convert Jupiter route to token mint strings"""
     out = []
@@ -87,12 +119,12 @@ def _get_jupiter_quote(
             "slippageBps": slippage_bps,
         }
         
-        response = requests.get(JUPITER_API_URL, params=params, timeout=30)
+        response = _jupiter_request("GET", JUPITER_API_URL, params=params)
         if response.status_code != 200:
             raise HTTPException(400, f"Jupiter API error: {response.text}")
         
-        return response.json()
-    except requests.RequestException as e:
+        return orjson.loads(response.content)
+    except (httpx.HTTPError, ValueError) as e:
         raise HTTPException(500, f"Failed to get Jupiter quote: {str(e)}")
 
 def _get_jupiter_swap_transaction(
@@ -108,13 +140,17 @@ def _get_jupiter_swap_transaction(
             "slippageBps": slippage_bps,
         }
         
-        response = requests.post(JUPITER_SWAP_URL, json=payload, timeout=30)
+        response = _jupiter_request(
+            "POST", JUPITER_SWAP_URL,
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"}
+        )
         if response.status_code != 200:
             raise HTTPException(400, f"Jupiter swap API error: {response.text}")
         
-        swap_data = response.json()
+        swap_data = orjson.loads(response.content)
         return swap_data["swapTransaction"]
-    except requests.RequestException as e:
+    except (httpx.HTTPError, ValueError) as e:
         raise HTTPException(500, f"Failed to get Jupiter swap transaction: {str(e)}")
 
 # -------- Quotes --------
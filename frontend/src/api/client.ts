@@ -1,7 +1,7 @@
 // Chain service configuration
 const CHAIN_API_BASE_URL = '/api'
 // ML service configuration
-const ML_API_BASE_URL = import.meta.env.VITE_ML_API_BASE_URL || 'http://localhost:8001'
+export const ML_API_BASE_URL = import.meta.env.VITE_ML_API_BASE_URL || 'http://localhost:8001'
 
 interface ApiResponse<T = any> {
   data: T
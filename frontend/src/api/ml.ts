@@ -3,7 +3,7 @@
  * Comprehensive TypeScript API wrapper for UnityWallet ML Service
  */
 
-import { mlApiClient } from './client'
+import { mlApiClient, ML_API_BASE_URL } from './client'
 
 // ====== Type Definitions ======
 
@@ -426,6 +426,37 @@ export const mlApi = {
     }
   },
 
+  /**
+   * Chat with AI assistant, streaming the answer chunk by chunk
+   */
+  async askChatbotStream(request: ChatbotRequest, onChunk: (chunk: string) => void): Promise<string> {
+    try {
+      const response = await fetch(`${ML_API_BASE_URL}/chatbot/ask/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(request),
+      })
+      if (!response.ok || !response.body) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let fullText = ''
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        const chunk = decoder.decode(value, { stream: true })
+        fullText += chunk
+        onChunk(chunk)
+      }
+      return fullText
+    } catch (error) {
+      console.error('Failed to stream chatbot answer:', error)
+      throw new Error('Unable to stream chatbot answer from ML service')
+    }
+  },
+
   /**
    * Get contextual chat suggestions based on wallet activity
    */
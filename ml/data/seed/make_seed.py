@@ -5,12 +5,9 @@ Creates realistic transaction data for different personas
 import pandas as pd
 import numpy as np
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 from pathlib import Path
-import json
-import random
 from typing import Dict, List
-from pathlib import Path
 
 # Load config
 import sys
@@ -25,85 +22,119 @@ def load_mcc_mapping():
     with open(DICTS_ROOT / "mcc_mapping.json", "r", encoding="utf-8") as f:
         return json.load(f)
 
+CHANNELS = np.array(["mobile_app", "web", "pos", "atm"])
+DEFAULT_LOCATIONS = ["Ho Chi Minh City", "Hanoi"]
+SYNTH_BASE_AMOUNTS = {
+    "F&B": 150000, "Transportation": 100000, "Shopping": 500000,
+    "Entertainment": 300000, "Travel": 2000000, "Healthcare": 800000
+}
+
+def index_mcc_by_category(mcc_data: Dict) -> Dict[str, Dict[str, np.ndarray]]:
+    """Group MCC codes with their subcategory/description arrays per category"""
+    grouped: Dict[str, List] = {}
+    for mcc, data in mcc_data["mcc_categories"].items():
+        grouped.setdefault(data["category"], []).append((mcc, data["subcategory"], data["description"]))
+    return {
+        category: {
+            "mcc": np.array([row[0] for row in rows]),
+            "subcategory": np.array([row[1] for row in rows]),
+            "description": np.array([row[2] for row in rows]),
+        }
+        for category, rows in grouped.items()
+    }
+
+def assemble_transactions(
+    user_id: str,
+    categories: List[str],
+    cat_idx: np.ndarray,
+    amounts: np.ndarray,
+    is_outlier: np.ndarray,
+    dates: pd.DatetimeIndex,
+    locations: List[str],
+    mcc_index: Dict[str, Dict[str, np.ndarray]],
+    rng: np.random.Generator,
+) -> List[Dict]:
+    """Build transaction records from per-row arrays (one RNG call per column, not per row)"""
+    n = len(cat_idx)
+    category_col = np.asarray(categories, dtype=object)[cat_idx]
+    mcc_col = np.empty(n, dtype=object)
+    subcategory_col = np.empty(n, dtype=object)
+    merchant_col = np.empty(n, dtype=object)
+
+    # Pick MCC per category group instead of per transaction
+    for k, category in enumerate(categories):
+        mask = cat_idx == k
+        count = int(mask.sum())
+        if not count:
+            continue
+        options = mcc_index.get(category)
+        if options is None:
+            mcc_col[mask] = "0000"  # Default
+            subcategory_col[mask] = "Other"
+            merchant_col[mask] = f"{category} Transaction"
+            continue
+        pick = rng.integers(0, len(options["mcc"]), count)
+        mcc_col[mask] = options["mcc"][pick]
+        subcategory_col[mask] = options["subcategory"][pick]
+        merchant_col[mask] = options["description"][pick]
+
+    frame = pd.DataFrame({
+        "transaction_id": [f"TXN_{user_id}_{i:04d}" for i in range(n)],
+        "user_id": user_id,
+        "amount": np.round(amounts, 2),
+        "currency": "VND",
+        "description": merchant_col + " - " + subcategory_col,
+        "mcc": mcc_col,
+        "category": category_col,
+        "subcategory": subcategory_col,
+        "merchant_name": merchant_col,
+        "transaction_date": dates.strftime("%Y-%m-%dT%H:%M:%S.%f"),
+        "location": rng.choice(locations, n),
+        "country": "VN",
+        "is_weekend": np.asarray(dates.dayofweek >= 5),
+        "is_outlier": is_outlier,
+        "device_id": f"device_{user_id}",
+        "ip_address": np.char.add("192.168.1.", rng.integers(1, 256, n).astype(str)),
+        "channel": rng.choice(CHANNELS, n),
+    })
+    return frame.to_dict("records")
+
+def random_dates(end_date: datetime, n: int, rng: np.random.Generator, days: int = 180) -> pd.DatetimeIndex:
+    """Random transaction dates within the last `days` days"""
+    return pd.Timestamp(end_date) - pd.to_timedelta(rng.integers(0, days + 1, n), unit="D")
+
 def generate_persona_transactions(persona_config: Dict, num_transactions: int = 100) -> List[Dict]:
     """Generate transactions for a specific persona"""
-    transactions = []
-    mcc_data = load_mcc_mapping()
+    rng = np.random.default_rng()
+    mcc_index = index_mcc_by_category(load_mcc_mapping())
+    n = num_transactions
     
     # Time range: last 6 months
     end_date = datetime.now()
-    start_date = end_date - timedelta(days=180)
+    dates = random_dates(end_date, n, rng)
     
-    for i in range(num_transactions):
-        # Random date in range
-        random_days = random.randint(0, 180)
-        transaction_date = end_date - timedelta(days=random_days)
-        
-        # Choose category based on persona preferences
-        category = np.random.choice(
-            list(persona_config["category_preferences"].keys()),
-            p=list(persona_config["category_preferences"].values())
-        )
-        
-        # Get MCC for category
-        category_mccs = [
-            mcc for mcc, data in mcc_data["mcc_categories"].items()
-            if data["category"] == category
-        ]
-        
-        if not category_mccs:
-            category_mccs = ["0000"]  # Default
-            
-        mcc = random.choice(category_mccs)
-        mcc_info = mcc_data["mcc_categories"].get(mcc, {
-            "category": category,
-            "subcategory": "Other", 
-            "description": f"{category} Transaction"
-        })
-        
-        # Amount based on category and persona spending pattern
-        base_amount = persona_config["spending_ranges"][category]
-        amount = np.random.normal(base_amount["mean"], base_amount["std"])
-        amount = max(amount, base_amount["min"])
-        amount = min(amount, base_amount["max"])
-        
-        # Add some weekend/weekday patterns
-        is_weekend = transaction_date.weekday() >= 5
-        if is_weekend and category in ["Entertainment", "F&B"]:
-            amount *= 1.2  # Spend more on weekends
-            
-        # Add location info
-        locations = persona_config.get("locations", ["Ho Chi Minh City", "Hanoi"])
-        location = random.choice(locations)
-        
-        # Add some outliers for anomaly detection
-        is_outlier = random.random() < 0.05  # 5% outliers
-        if is_outlier:
-            amount *= random.uniform(3, 10)  # Make it 3-10x normal
-            
-        transaction = {
-            "transaction_id": f"TXN_{persona_config['user_id']}_{i:04d}",
-            "user_id": persona_config["user_id"],
-            "amount": round(amount, 2),
-            "currency": "VND",
-            "description": f"{mcc_info['description']} - {mcc_info['subcategory']}",
-            "mcc": mcc,
-            "category": category,
-            "subcategory": mcc_info["subcategory"],
-            "merchant_name": mcc_info["description"],
-            "transaction_date": transaction_date.isoformat(),
-            "location": location,
-            "country": "VN",
-            "is_weekend": is_weekend,
-            "is_outlier": is_outlier,
-            "device_id": f"device_{persona_config['user_id']}",
-            "ip_address": f"192.168.1.{random.randint(1, 255)}",
-            "channel": random.choice(["mobile_app", "web", "pos", "atm"])
-        }
-        
-        transactions.append(transaction)
+    # Choose category based on persona preferences
+    categories = list(persona_config["category_preferences"].keys())
+    cat_idx = rng.choice(len(categories), size=n, p=list(persona_config["category_preferences"].values()))
+    
+    # Amount based on category and persona spending pattern
+    ranges = [persona_config["spending_ranges"][category] for category in categories]
+    mean, std, lo, hi = (np.array([r[key] for r in ranges], dtype=float)[cat_idx] for key in ("mean", "std", "min", "max"))
+    amounts = np.clip(rng.normal(mean, std), lo, hi)
+    
+    # Add some weekend/weekday patterns
+    weekend_boost = np.isin(categories, ["Entertainment", "F&B"])[cat_idx] & np.asarray(dates.dayofweek >= 5)
+    amounts = np.where(weekend_boost, amounts * 1.2, amounts)  # Spend more on weekends
+    
+    # Add some outliers for anomaly detection
+    is_outlier = rng.random(n) < 0.05  # 5% outliers
+    amounts = np.where(is_outlier, amounts * rng.uniform(3, 10, n), amounts)  # Make it 3-10x normal
     
-    return transactions
+    locations = persona_config.get("locations", DEFAULT_LOCATIONS)
+    return assemble_transactions(
+        persona_config["user_id"], categories, cat_idx, amounts, is_outlier,
+        dates, locations, mcc_index, rng
+    )
 
 def create_personas():
     """Define different user personas for testing"""
@@ -324,8 +355,8 @@ def main():
     
     # Time range: last 6 months (redefine since we're outside the function)
     end_date = datetime.now()
-    start_date = end_date - timedelta(days=180)
-    mcc_data = load_mcc_mapping()  # Load MCC data
+    mcc_index = index_mcc_by_category(load_mcc_mapping())  # Load MCC data once
+    rng = np.random.default_rng()
     
     # Create additional synthetic users with different credit profiles
     additional_users = []
@@ -373,65 +404,22 @@ def main():
             outlier_rate = 0.20
         
         # Generate transactions for this synthetic user
-        synthetic_txns = []
-        for j in range(num_txns):
-            # Random date
-            random_days = random.randint(0, 180)
-            transaction_date = end_date - timedelta(days=random_days)
-            
-            # Choose category based on risk profile
-            category = np.random.choice(
-                list(spending_categories.keys()),
-                p=list(spending_categories.values())
-            )
-            
-            # Amount with volatility based on risk profile
-            base_amounts = {
-                "F&B": 150000, "Transportation": 100000, "Shopping": 500000,
-                "Entertainment": 300000, "Travel": 2000000, "Healthcare": 800000
-            }
-            
-            base_amount = base_amounts.get(category, 200000)
-            amount = base_amount * np.random.lognormal(0, 0.5) * volatility_factor
-            
-            # Add outliers based on risk profile
-            is_outlier = random.random() < outlier_rate
-            if is_outlier:
-                amount *= random.uniform(5, 15)
-            
-            # Get MCC
-            category_mccs = [
-                mcc for mcc, data in mcc_data["mcc_categories"].items()
-                if data["category"] == category
-            ]
-            mcc = random.choice(category_mccs) if category_mccs else "0000"
-            mcc_info = mcc_data["mcc_categories"].get(mcc, {
-                "category": category, "subcategory": "Other", "description": f"{category} Transaction"
-            })
-            
-            is_weekend = transaction_date.weekday() >= 5
-            
-            transaction = {
-                "transaction_id": f"TXN_{user_id}_{j:04d}",
-                "user_id": user_id,
-                "amount": round(amount, 2),
-                "currency": "VND",
-                "description": f"{mcc_info['description']} - {mcc_info['subcategory']}",
-                "mcc": mcc,
-                "category": category,
-                "subcategory": mcc_info["subcategory"],
-                "merchant_name": mcc_info["description"],
-                "transaction_date": transaction_date.isoformat(),
-                "location": random.choice(["Ho Chi Minh City", "Hanoi", "Da Nang"]),
-                "country": "VN",
-                "is_weekend": is_weekend,
-                "is_outlier": is_outlier,
-                "device_id": f"device_{user_id}",
-                "ip_address": f"192.168.1.{random.randint(1, 255)}",
-                "channel": random.choice(["mobile_app", "web", "pos", "atm"])
-            }
-            
-            synthetic_txns.append(transaction)
+        categories = list(spending_categories.keys())
+        cat_idx = rng.choice(len(categories), size=num_txns, p=list(spending_categories.values()))
+        dates = random_dates(end_date, num_txns, rng)
+        
+        # Amount with volatility based on risk profile
+        base_amounts = np.array([SYNTH_BASE_AMOUNTS.get(category, 200000) for category in categories], dtype=float)
+        amounts = base_amounts[cat_idx] * rng.lognormal(0, 0.5, num_txns) * volatility_factor
+        
+        # Add outliers based on risk profile
+        is_outlier = rng.random(num_txns) < outlier_rate
+        amounts = np.where(is_outlier, amounts * rng.uniform(5, 15, num_txns), amounts)
+        
+        synthetic_txns = assemble_transactions(
+            user_id, categories, cat_idx, amounts, is_outlier,
+            dates, ["Ho Chi Minh City", "Hanoi", "Da Nang"], mcc_index, rng
+        )
         
         all_transactions.extend(synthetic_txns)
     
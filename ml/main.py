@@ -3,15 +3,20 @@ ML Service cho UnityWallet
 Cung cấp feature engineering, phân tích giao dịch và cảnh báo bất thường
 """
 
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from routers import analytics, anomaly_detection, chatbot
 from core.config import settings
+from services.solana_data_collector import solana_collector
+from services.enhanced_chatbot import get_enhanced_chatbot_service
 
 app = FastAPI(
     title="UnityWallet ML Service",
     description="Machine Learning services for transaction analysis and anomaly detection",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware - Allow all origins for development
@@ -30,6 +35,18 @@ app.include_router(analytics.router, prefix="/analytics", tags=["analytics"])
 app.include_router(anomaly_detection.router, prefix="/anomaly", tags=["anomaly"])
 app.include_router(chatbot.router, prefix="/chatbot", tags=["chatbot"])
 
+@app.on_event("startup")
+async def startup_event():
+    """Warm up outbound connections and the LLM chatbot before the first request"""
+    await asyncio.gather(
+        solana_collector.warmup(),
+        asyncio.to_thread(get_enhanced_chatbot_service)
+    )
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await solana_collector.close()
+
 @app.get("/")
 async def root():
     """Root endpoint"""
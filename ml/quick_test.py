@@ -16,26 +16,28 @@ TEST_ACCOUNTS = [
 ]
 
 async def quick_test(account: str):
-    """Test nhanh một account"""
-    print(f"\n🧪 Testing: {account}")
-    print("-" * 80)
+    """Test nhanh một account, trả về (success, output lines)"""
+    lines = []
+    out = lines.append  # buffered so concurrent tests print in order
+    out(f"\n🧪 Testing: {account}")
+    out("-" * 80)
     
     async with httpx.AsyncClient(timeout=30.0) as client:
         try:
             # Test Features
-            print("📊 Features...")
+            out("📊 Features...")
             response = await client.get(f"{ML_SERVICE_URL}/analytics/features/{account}?days_back=30")
             
             if response.status_code == 200:
                 data = response.json()
-                print(f"✅ Total transactions: {data.get('total_transactions', 0)}")
-                print(f"✅ Monthly average: {data.get('transactions_per_month', 0):.2f}")
+                out(f"✅ Total transactions: {data.get('total_transactions', 0)}")
+                out(f"✅ Monthly average: {data.get('transactions_per_month', 0):.2f}")
             else:
-                print(f"❌ Features failed: {response.status_code}")
-                return False
+                out(f"❌ Features failed: {response.status_code}")
+                return False, lines
                 
             # Test Chatbot
-            print("\n🤖 Chatbot...")
+            out("\n🤖 Chatbot...")
             response = await client.post(
                 f"{ML_SERVICE_URL}/chatbot/chat",
                 json={
@@ -47,16 +49,16 @@ async def quick_test(account: str):
             
             if response.status_code == 200:
                 data = response.json()
-                print(f"✅ Chatbot response: {data.get('response', '')[:100]}...")
-                print(f"✅ Suggestions: {len(data.get('suggestions', []))}")
+                out(f"✅ Chatbot response: {data.get('response', '')[:100]}...")
+                out(f"✅ Suggestions: {len(data.get('suggestions', []))}")
             else:
-                print(f"❌ Chatbot failed: {response.status_code}")
+                out(f"❌ Chatbot failed: {response.status_code}")
                 
-            return True
+            return True, lines
             
         except Exception as e:
-            print(f"❌ Test failed: {e}")
-            return False
+            out(f"❌ Test failed: {e}")
+            return False, lines
 
 async def main():
     print("🚀 QUICK STELLAR ACCOUNT TESTS")
@@ -64,8 +66,10 @@ async def main():
     
     working_accounts = []
     
-    for account in TEST_ACCOUNTS:
-        success = await quick_test(account)
+    # Run accounts concurrently, print buffered output in submission order
+    results = await asyncio.gather(*(quick_test(account) for account in TEST_ACCOUNTS))
+    for account, (success, lines) in zip(TEST_ACCOUNTS, results):
+        print("\n".join(lines))
         if success:
             working_accounts.append(account)
     
@@ -3,7 +3,10 @@ Chatbot API Router
 AI Assistant cho phân tích giao dịch
 """
 
-from fastapi import APIRouter, HTTPException, BackgroundTasks
+import time
+from collections import OrderedDict
+from fastapi import APIRouter, HTTPException, BackgroundTasks, Response, Depends
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Any, Optional
 
 from models.schemas import ChatbotRequest, ChatbotResponse
@@ -11,33 +14,98 @@ from services.solana_data_collector import solana_collector
 from services.feature_engineering import feature_service
 from services.anomaly_detection import anomaly_service
 from services.chatbot import chatbot_service
+from services.enhanced_chatbot import EnhancedChatbotService, get_enhanced_chatbot_service
 
 router = APIRouter()
 
+# Short-lived cache of (transactions, features, anomalies) per (public_key, days_back),
+# so follow-up questions in the same conversation skip collection + ML passes
+CONTEXT_CACHE_TTL_SECONDS = 60
+CONTEXT_CACHE_MAX_SIZE = 256
+_context_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+
+# Dashboard widgets poll suggestions/quick-stats; reuse results for a short window
+POLL_CACHE_TTL_SECONDS = 30
+POLL_CACHE_MAX_SIZE = 1024
+_suggestions_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_quick_stats_cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+def _cache_get(cache: OrderedDict, key, ttl: float):
+    """Trả về giá trị còn hạn trong cache, hoặc None"""
+    cached = cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+    return None
+
+def _cache_put(cache: OrderedDict, key, value, max_size: int):
+    """Lưu giá trị vào cache, bỏ entry cũ nhất khi vượt max_size"""
+    cache[key] = (time.monotonic(), value)
+    cache.move_to_end(key)
+    while len(cache) > max_size:
+        cache.popitem(last=False)
+
+def invalidate_wallet_cache(public_key: str):
+    """Xóa mọi kết quả cache của một wallet (gọi khi có giao dịch mới)"""
+    _suggestions_cache.pop(public_key, None)
+    _quick_stats_cache.pop(public_key, None)
+    for key in [k for k in _context_cache if k[0] == public_key]:
+        del _context_cache[key]
+
+async def _collect_chat_context(request: ChatbotRequest):
+    """Validate request và thu thập transactions, features, anomalies cho chatbot"""
+    if len(request.public_key) < 32 or len(request.public_key) > 48:
+        raise HTTPException(400, "Invalid Solana public key format")
+    
+    if not request.message.strip():
+        raise HTTPException(400, "Message cannot be empty")
+    
+    # Collect data for analysis
+    days_back = 30  # Default context
+    if "tháng" in request.message.lower() or "month" in request.message.lower():
+        days_back = 90
+    elif "tuần" in request.message.lower() or "week" in request.message.lower():
+        days_back = 7
+    
+    cache_key = (request.public_key, days_back)
+    cached = _cache_get(_context_cache, cache_key, CONTEXT_CACHE_TTL_SECONDS)
+    if cached is not None:
+        return cached
+    
+    transactions = await solana_collector.collect_full_history(
+        account=request.public_key,
+        days_back=days_back,
+        max_records=1000
+    )
+    
+    if not transactions:
+        return transactions, None, []
+    
+    balances = await solana_collector.get_account_balances(request.public_key)
+    
+    # Calculate features and detect anomalies
+    features = feature_service.calculate_features(
+        transactions=transactions,
+        balances=balances,
+        period_days=days_back
+    )
+    
+    anomalies = anomaly_service.detect_anomalies(
+        transactions=transactions,
+        features=features
+    )
+    
+    result = (transactions, features, anomalies)
+    _cache_put(_context_cache, cache_key, result, CONTEXT_CACHE_MAX_SIZE)
+    
+    return result
+
 @router.post("/ask")
 async def chat_with_assistant(request: ChatbotRequest):
     """
     Chat với AI assistant về giao dịch và phân tích
     """
     try:
-        if len(request.public_key) < 32 or len(request.public_key) > 48:
-            raise HTTPException(400, "Invalid Solana public key format")
-        
-        if not request.message.strip():
-            raise HTTPException(400, "Message cannot be empty")
-        
-        # Collect data for analysis
-        days_back = 30  # Default context
-        if "tháng" in request.message.lower() or "month" in request.message.lower():
-            days_back = 90
-        elif "tuần" in request.message.lower() or "week" in request.message.lower():
-            days_back = 7
-        
-        transactions = await solana_collector.collect_full_history(
-            account=request.public_key,
-            days_back=days_back,
-            max_records=1000
-        )
+        transactions, features, anomalies = await _collect_chat_context(request)
         
         if not transactions:
             return ChatbotResponse(
@@ -50,20 +118,6 @@ async def chat_with_assistant(request: ChatbotRequest):
                 ]
             )
         
-        balances = await solana_collector.get_account_balances(request.public_key)
-        
-        # Calculate features and detect anomalies
-        features = feature_service.calculate_features(
-            transactions=transactions,
-            balances=balances,
-            period_days=days_back
-        )
-        
-        anomalies = anomaly_service.detect_anomalies(
-            transactions=transactions,
-            features=features
-        )
-        
         # Process with chatbot
         response = chatbot_service.process_message(
             request=request,
@@ -79,8 +133,33 @@ async def chat_with_assistant(request: ChatbotRequest):
     except Exception as e:
         raise HTTPException(500, f"Chat processing failed: {str(e)}")
 
+@router.post("/ask/stream")
+async def chat_with_assistant_stream(
+    request: ChatbotRequest,
+    enhanced_chatbot: EnhancedChatbotService = Depends(get_enhanced_chatbot_service)
+):
+    """
+    Chat với AI assistant (Gemini), stream câu trả lời dạng text/plain
+    """
+    try:
+        transactions, features, anomalies = await _collect_chat_context(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Chat processing failed: {str(e)}")
+    
+    return StreamingResponse(
+        enhanced_chatbot.stream_message(
+            request=request,
+            transactions=transactions,
+            features=features,
+            anomalies=anomalies
+        ),
+        media_type="text/plain; charset=utf-8"
+    )
+
 @router.get("/suggestions/{public_key}")
-async def get_chat_suggestions(public_key: str):
+async def get_chat_suggestions(public_key: str, response: Response):
     """
     Lấy gợi ý câu hỏi dựa trên hoạt động của wallet
     """
@@ -88,6 +167,11 @@ async def get_chat_suggestions(public_key: str):
         if len(public_key) < 32 or len(public_key) > 48:
             raise HTTPException(400, "Invalid Solana public key format")
         
+        response.headers["Cache-Control"] = f"private, max-age={POLL_CACHE_TTL_SECONDS}"
+        cached = _cache_get(_suggestions_cache, public_key, POLL_CACHE_TTL_SECONDS)
+        if cached is not None:
+            return cached
+        
         # Quick analysis for suggestions
         transactions = await solana_collector.collect_full_history(
             account=public_key,
@@ -130,9 +214,10 @@ async def get_chat_suggestions(public_key: str):
             
             # Recent activity
             from datetime import datetime, timedelta, timezone
+            recent_cutoff = datetime.now(timezone.utc) - timedelta(days=7)
             recent_txs = [
                 tx for tx in transactions 
-                if tx.timestamp >= datetime.now(timezone.utc) - timedelta(days=7)
+                if tx.timestamp >= recent_cutoff
             ]
             
             if recent_txs:
@@ -140,7 +225,7 @@ async def get_chat_suggestions(public_key: str):
             else:
                 suggestions.append("Tại sao gần đây tôi ít giao dịch?")
         
-        return {
+        result = {
             "public_key": public_key,
             "suggestions": suggestions[:8],  # Limit to 8 suggestions
             "context": {
@@ -152,6 +237,8 @@ async def get_chat_suggestions(public_key: str):
                 ]
             }
         }
+        _cache_put(_suggestions_cache, public_key, result, POLL_CACHE_MAX_SIZE)
+        return result
         
     except Exception as e:
         raise HTTPException(500, f"Suggestions failed: {str(e)}")
@@ -166,6 +253,10 @@ async def get_quick_stats(request: Dict[str, str]):
         if not public_key or not public_key.startswith('G'):
             raise HTTPException(400, "Valid public_key required")
         
+        cached = _cache_get(_quick_stats_cache, public_key, POLL_CACHE_TTL_SECONDS)
+        if cached is not None:
+            return cached
+        
         # Quick data collection
         transactions = await solana_collector.collect_full_history(
             account=public_key,
@@ -201,12 +292,14 @@ async def get_quick_stats(request: Dict[str, str]):
             "account_age_days": (max(transactions, key=lambda x: x.timestamp).timestamp - min(transactions, key=lambda x: x.timestamp).timestamp).days if len(transactions) > 1 else 0
         }
         
-        return {
+        result = {
             "status": "success",
             "public_key": public_key,
             "stats": stats,
             "summary": _generate_quick_summary(stats)
         }
+        _cache_put(_quick_stats_cache, public_key, result, POLL_CACHE_MAX_SIZE)
+        return result
         
     except Exception as e:
         raise HTTPException(500, f"Quick stats failed: {str(e)}")
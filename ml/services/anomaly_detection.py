@@ -3,18 +3,28 @@ Anomaly Detection Service
 Phát hiện các giao dịch bất thường và cảnh báo
 """
 
+import hashlib
 import numpy as np
 import pandas as pd
+from collections import OrderedDict
 from typing import List, Dict, Any, Optional, Tuple
-from datetime import datetime, timedelta
+from datetime import datetime
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import DBSCAN
 from models.schemas import (
     TransactionRecord, AnomalyDetection, FeatureEngineering
 )
 from core.config import settings
 
+# Giờ bất thường (2-5 AM) dạng bảng tra 24 phần tử: mask[hours] thay cho isin
+UNUSUAL_HOUR_MASK = np.zeros(24, dtype=bool)
+UNUSUAL_HOUR_MASK[[2, 3, 4, 5]] = True
+
+# Thứ tự cột của ma trận đặc trưng cho Isolation Forest
+ML_FEATURE_COLUMNS = (
+    'amount', 'hour', 'day_of_week', 'is_weekend', 'fee', 'is_payment', 'is_swap'
+)
+
 class AnomalyDetectionService:
     """Service phát hiện anomalies trong giao dịch"""
     
@@ -23,8 +33,12 @@ class AnomalyDetectionService:
             contamination=settings.anomaly_threshold,
             random_state=42
         )
-        self.scaler = StandardScaler()
+        # Chuẩn hoá tại chỗ trên ma trận float32 (Isolation Forest cũng làm việc với float32)
+        self.scaler = StandardScaler(copy=False)
         self.models_trained = False
+        # LRU kết quả Isolation Forest theo hash ma trận đặc trưng: cùng lịch sử
+        # giao dịch (random_state cố định) thì không cần fit lại
+        self._ml_cache: "OrderedDict[str, tuple]" = OrderedDict()
     
     def detect_anomalies(
         self, 
@@ -56,25 +70,30 @@ class AnomalyDetectionService:
     
     def _transactions_to_dataframe(self, transactions: List[TransactionRecord]) -> pd.DataFrame:
         """Convert transactions to DataFrame"""
-        data = []
-        for tx in transactions:
-            data.append({
-                'hash': tx.hash,
-                'account': tx.account,
-                'transaction_type': tx.transaction_type.value,
-                'amount': tx.amount or 0.0,
-                'asset_code': tx.asset.code if tx.asset else 'XLM',
-                'destination': tx.destination,
-                'source': tx.source,
-                'fee': tx.fee,
-                'timestamp': tx.timestamp,
-                'success': tx.success,
-                'hour': tx.timestamp.hour,
-                'day_of_week': tx.timestamp.weekday(),
-                'is_weekend': tx.timestamp.weekday() >= 5
-            })
-        
-        return pd.DataFrame(data)
+        df = pd.DataFrame({
+            'hash': [tx.hash for tx in transactions],
+            'account': [tx.account for tx in transactions],
+            'transaction_type': [tx.transaction_type.value for tx in transactions],
+            'amount': [tx.amount or 0.0 for tx in transactions],
+            'asset_code': [tx.asset.code if tx.asset else 'XLM' for tx in transactions],
+            'destination': [tx.destination for tx in transactions],
+            'source': [tx.source for tx in transactions],
+            'fee': [tx.fee for tx in transactions],
+            'timestamp': [tx.timestamp for tx in transactions],
+            'success': [tx.success for tx in transactions],
+        })
+        
+        # Tách giờ/thứ một lần trên cả cột; timezone lẫn lộn (cột object) thì lấy từng phần tử
+        timestamps = df['timestamp']
+        if pd.api.types.is_datetime64_any_dtype(timestamps):
+            df['hour'] = timestamps.dt.hour
+            df['day_of_week'] = timestamps.dt.dayofweek
+        else:
+            df['hour'] = [ts.hour for ts in timestamps]
+            df['day_of_week'] = [ts.weekday() for ts in timestamps]
+        df['is_weekend'] = df['day_of_week'] >= 5
+        
+        return df
     
     def _detect_amount_anomalies(self, df: pd.DataFrame, account: str) -> List[AnomalyDetection]:
         """Phát hiện anomalies về số tiền giao dịch"""
@@ -92,11 +111,11 @@ class AnomalyDetectionService:
             z_scores = np.abs((amounts - mean_amount) / std_amount)
             outlier_threshold = 3.0
             
-            outlier_indices = amounts[z_scores > outlier_threshold].index
+            outlier_mask = z_scores > outlier_threshold
+            confidences = np.minimum(0.95, (z_scores[outlier_mask] - outlier_threshold) / 2.0 + 0.7)
             
-            for idx in outlier_indices:
+            for idx, confidence in confidences.items():
                 tx_row = df.loc[idx]
-                confidence = min(0.95, (z_scores.loc[idx] - outlier_threshold) / 2.0 + 0.7)
                 
                 anomaly = AnomalyDetection(
                     account=account,
@@ -115,33 +134,33 @@ class AnomalyDetectionService:
         """Phát hiện anomalies về tần suất giao dịch"""
         anomalies = []
         
-        # Group by day and count transactions
-        df['date'] = df['timestamp'].dt.date
-        daily_counts = df.groupby('date').size()
+        # Group by day and count transactions: mã hoá ngày thành int rồi đếm bằng bincount
+        day_codes, days = pd.factorize(df['timestamp'].dt.normalize(), sort=True)
+        daily_counts = np.bincount(day_codes)
         
         if len(daily_counts) < 7:  # Cần ít nhất 1 tuần data
             return anomalies
         
         mean_daily = daily_counts.mean()
-        std_daily = daily_counts.std()
+        std_daily = daily_counts.std(ddof=1)
         
         if std_daily > 0:
             # Detect days with unusually high transaction count
             high_activity_threshold = mean_daily + 2 * std_daily
             
-            for date, count in daily_counts.items():
-                if count > high_activity_threshold:
-                    confidence = min(0.90, (count - high_activity_threshold) / mean_daily * 0.3 + 0.6)
-                    
-                    anomaly = AnomalyDetection(
-                        account=account,
-                        timestamp=datetime.combine(date, datetime.min.time()),
-                        anomaly_type="high_frequency",
-                        confidence_score=confidence,
-                        description=f"Hoạt động giao dịch bất thường cao: {count} giao dịch trong ngày (trung bình: {mean_daily:.1f})",
-                        recommended_action="Kiểm tra hoạt động tài khoản trong ngày này"
-                    )
-                    anomalies.append(anomaly)
+            for i in np.flatnonzero(daily_counts > high_activity_threshold):
+                count = daily_counts[i]
+                confidence = min(0.90, (count - high_activity_threshold) / mean_daily * 0.3 + 0.6)
+                
+                anomaly = AnomalyDetection(
+                    account=account,
+                    timestamp=datetime.combine(days[i].date(), datetime.min.time()),
+                    anomaly_type="high_frequency",
+                    confidence_score=confidence,
+                    description=f"Hoạt động giao dịch bất thường cao: {count} giao dịch trong ngày (trung bình: {mean_daily:.1f})",
+                    recommended_action="Kiểm tra hoạt động tài khoản trong ngày này"
+                )
+                anomalies.append(anomaly)
         
         return anomalies
     
@@ -149,12 +168,8 @@ class AnomalyDetectionService:
         """Phát hiện anomalies về thời gian giao dịch"""
         anomalies = []
         
-        # Unusual hour activity (giao dịch vào giờ không bình thường)
-        hour_counts = df['hour'].value_counts()
-        
-        # Detect activity in unusual hours (2-5 AM)
-        unusual_hours = [2, 3, 4, 5]
-        unusual_activity = df[df['hour'].isin(unusual_hours)]
+        # Unusual hour activity (giao dịch vào giờ không bình thường): 2-5 AM
+        unusual_activity = df[UNUSUAL_HOUR_MASK[df['hour'].to_numpy(dtype=np.int64)]]
         
         if not unusual_activity.empty:
             for _, tx in unusual_activity.iterrows():
@@ -172,13 +187,14 @@ class AnomalyDetectionService:
                 anomalies.append(anomaly)
         
         # Weekend activity (nếu thường không giao dịch cuối tuần)
-        weekend_txs = df[df['is_weekend']]
-        weekday_txs = df[~df['is_weekend']]
+        weekend_mask = df['is_weekend'].to_numpy(dtype=bool)
+        weekend_count = int(weekend_mask.sum())
         
-        if len(weekday_txs) > 0 and len(weekend_txs) > 0:
-            weekend_ratio = len(weekend_txs) / len(df)
+        # Ratio từ boolean mask; chỉ lọc DataFrame khi thực sự cần tạo cảnh báo
+        if 0 < weekend_count < len(df):
+            weekend_ratio = weekend_count / len(df)
             if weekend_ratio > 0.4:  # >40% giao dịch vào cuối tuần
-                for _, tx in weekend_txs.iterrows():
+                for _, tx in df[weekend_mask].iterrows():
                     anomaly = AnomalyDetection(
                         account=account,
                         timestamp=tx['timestamp'],
@@ -198,10 +214,12 @@ class AnomalyDetectionService:
         
         # Rapid sequential transactions (giao dịch liên tiếp quá nhanh)
         df_sorted = df.sort_values('timestamp')
-        time_diffs = df_sorted['timestamp'].diff()
+        epoch_ns = pd.to_datetime(df_sorted['timestamp'], utc=True).to_numpy(dtype='datetime64[ns]').view(np.int64)
         
-        # Detect transactions within 1 minute of each other
-        rapid_txs = df_sorted[time_diffs <= timedelta(minutes=1)]
+        # Detect transactions within 1 minute of each other (int64 diff, first row has no predecessor)
+        rapid_mask = np.zeros(len(epoch_ns), dtype=bool)
+        rapid_mask[1:] = np.diff(epoch_ns) <= 60 * 1_000_000_000
+        rapid_txs = df_sorted[rapid_mask]
         
         for _, tx in rapid_txs.iterrows():
             anomaly = AnomalyDetection(
@@ -241,53 +259,64 @@ class AnomalyDetectionService:
             return anomalies
         
         try:
-            # Prepare features for ML
-            features = []
-            for _, tx in df.iterrows():
-                feature_vector = [
-                    tx['amount'],
-                    tx['hour'],
-                    tx['day_of_week'],
-                    1 if tx['is_weekend'] else 0,
-                    tx['fee'],
-                    1 if tx['transaction_type'] == 'payment' else 0,
-                    1 if tx['transaction_type'] == 'swap' else 0
-                ]
-                features.append(feature_vector)
+            # Prepare features for ML: ma trận float32 (N, 7) cấp phát một lần, ghi theo cột
+            tx_types = df['transaction_type'].to_numpy()
+            X = np.empty((len(df), len(ML_FEATURE_COLUMNS)), dtype=np.float32)
+            X[:, 0] = df['amount'].to_numpy(dtype=np.float64)
+            X[:, 1] = df['hour'].to_numpy(dtype=np.float64)
+            X[:, 2] = df['day_of_week'].to_numpy(dtype=np.float64)
+            X[:, 3] = df['is_weekend'].to_numpy(dtype=np.float64)
+            X[:, 4] = df['fee'].to_numpy(dtype=np.float64)
+            X[:, 5] = tx_types == 'payment'
+            X[:, 6] = tx_types == 'swap'
             
-            X = np.array(features)
+            anomaly_labels, anomaly_scores = self._fit_isolation_forest(X)
             
-            # Standardize features
-            X_scaled = self.scaler.fit_transform(X)
+            # Convert anomaly score to confidence (higher negative score = more anomalous), cả mảng một lần
+            confidences = np.clip((np.abs(anomaly_scores) - 0.1) * 2, 0.5, 0.95)
             
-            # Detect anomalies using Isolation Forest
-            anomaly_labels = self.isolation_forest.fit_predict(X_scaled)
-            anomaly_scores = self.isolation_forest.decision_function(X_scaled)
-            
-            # Convert to anomaly objects
-            for i, (label, score) in enumerate(zip(anomaly_labels, anomaly_scores)):
-                if label == -1:  # Anomaly detected
-                    tx_row = df.iloc[i]
-                    
-                    # Convert anomaly score to confidence (higher negative score = more anomalous)
-                    confidence = min(0.95, max(0.5, (abs(score) - 0.1) * 2))
-                    
-                    anomaly = AnomalyDetection(
-                        account=account,
-                        timestamp=tx_row['timestamp'],
-                        anomaly_type="ml_detected",
-                        confidence_score=confidence,
-                        description=f"Giao dịch bất thường được phát hiện bởi ML (score: {score:.3f})",
-                        transaction_hash=tx_row['hash'],
-                        recommended_action="Phân tích chi tiết giao dịch này"
-                    )
-                    anomalies.append(anomaly)
+            # Convert to anomaly objects (chỉ duyệt các dòng bị gán nhãn -1)
+            for i in np.flatnonzero(anomaly_labels == -1):
+                tx_row = df.iloc[i]
+                
+                anomaly = AnomalyDetection(
+                    account=account,
+                    timestamp=tx_row['timestamp'],
+                    anomaly_type="ml_detected",
+                    confidence_score=confidences[i],
+                    description=f"Giao dịch bất thường được phát hiện bởi ML (score: {anomaly_scores[i]:.3f})",
+                    transaction_hash=tx_row['hash'],
+                    recommended_action="Phân tích chi tiết giao dịch này"
+                )
+                anomalies.append(anomaly)
         
         except Exception as e:
             print(f"ML anomaly detection error: {e}")
         
         return anomalies
     
+    def _fit_isolation_forest(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Chuẩn hoá + fit Isolation Forest, dùng lại kết quả nếu ma trận đã gặp"""
+        key = hashlib.blake2b(
+            f"{X.shape}{X.dtype}".encode("utf-8") + X.tobytes(), digest_size=16
+        ).hexdigest()
+        cached = self._ml_cache.get(key)
+        if cached is not None:
+            self._ml_cache.move_to_end(key)
+            return cached
+        
+        # Standardize features
+        X_scaled = self.scaler.fit_transform(X)
+        
+        # Detect anomalies using Isolation Forest
+        anomaly_labels = self.isolation_forest.fit_predict(X_scaled)
+        anomaly_scores = self.isolation_forest.decision_function(X_scaled)
+        
+        self._ml_cache[key] = (anomaly_labels, anomaly_scores)
+        while len(self._ml_cache) > settings.cache_max_size:
+            self._ml_cache.popitem(last=False)
+        return anomaly_labels, anomaly_scores
+    
     def get_risk_score(self, anomalies: List[AnomalyDetection]) -> float:
         """Tính risk score tổng thể từ các anomalies"""
         if not anomalies:
@@ -3,6 +3,7 @@ Chatbot Service
 Trợ lý AI để trả lời câu hỏi về giao dịch và phân tích
 """
 
+import heapq
 import re
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
@@ -14,6 +15,37 @@ from models.schemas import (
 class ChatbotService:
     """AI Assistant cho phân tích giao dịch và trả lời câu hỏi"""
     
+    # Static suggestion/label tables, built once instead of per message
+    BASE_SUGGESTIONS = (
+        "Số dư hiện tại của tôi",
+        "Có hoạt động bất thường nào không?",
+        "Tôi đã chi tiêu bao nhiêu tháng này?",
+        "Phân tích giao dịch của tôi"
+    )
+    INTENT_SUGGESTIONS = {
+        "balance_inquiry": (
+            "Biến động số dư như thế nào?",
+            "So sánh với tháng trước"
+        ),
+        "anomaly_check": (
+            "Làm sao để bảo mật tài khoản?",
+            "Cách thiết lập cảnh báo"
+        )
+    }
+    ACTIVE_USER_SUGGESTIONS = (
+        "Xu hướng giao dịch của tôi",
+        "Địa chỉ tôi gửi tiền nhiều nhất"
+    )
+    ANOMALY_TYPE_LABELS = {
+        "unusual_amount": "Số tiền bất thường",
+        "high_frequency": "Tần suất cao",
+        "unusual_time": "Thời gian bất thường",
+        "rapid_transactions": "Giao dịch liên tiếp",
+        "ml_detected": "Phát hiện bởi AI",
+        "round_number_bias": "Pattern số tròn",
+        "weekend_activity": "Hoạt động cuối tuần"
+    }
+    
     def __init__(self):
         self.context_cache = {}  # Cache để lưu context conversations
         
@@ -38,6 +70,22 @@ class ChatbotService:
                 r"gửi tiền cho ai", r"destination", r"người nhận"
             ]
         }
+        
+        # Compile one alternation per intent; dict order keeps intent priority
+        self._intent_patterns = [
+            (intent, re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE))
+            for intent, patterns in self.intents.items()
+        ]
+        
+        # Intent -> handler, all called as handler(message, transactions, features, anomalies)
+        self._handlers = {
+            "balance_inquiry": lambda m, t, f, a: self._handle_balance_inquiry(m, f),
+            "transaction_count": lambda m, t, f, a: self._handle_transaction_count(m, f, t),
+            "spending_analysis": lambda m, t, f, a: self._handle_spending_analysis(m, t, f),
+            "anomaly_check": lambda m, t, f, a: self._handle_anomaly_check(m, a),
+            "time_analysis": lambda m, t, f, a: self._handle_time_analysis(m, t, f),
+            "frequent_destinations": lambda m, t, f, a: self._handle_destinations(m, f),
+        }
     
     def process_message(
         self, 
@@ -51,22 +99,8 @@ class ChatbotService:
         message = request.message.lower()
         intent = self._detect_intent(message)
         
-        response_data = {}
-        
-        if intent == "balance_inquiry":
-            response, data = self._handle_balance_inquiry(message, features)
-        elif intent == "transaction_count":
-            response, data = self._handle_transaction_count(message, features, transactions)
-        elif intent == "spending_analysis":
-            response, data = self._handle_spending_analysis(message, transactions, features)
-        elif intent == "anomaly_check":
-            response, data = self._handle_anomaly_check(message, anomalies)
-        elif intent == "time_analysis":
-            response, data = self._handle_time_analysis(message, transactions, features)
-        elif intent == "frequent_destinations":
-            response, data = self._handle_destinations(message, features)
-        else:
-            response, data = self._handle_general_query(message, transactions, features, anomalies)
+        handler = self._handlers.get(intent, self._handle_general_query)
+        response, data = handler(message, transactions, features, anomalies)
         
         suggestions = self._generate_suggestions(intent, transactions, features)
         
@@ -78,10 +112,9 @@ class ChatbotService:
     
     def _detect_intent(self, message: str) -> str:
         """Phát hiện intent từ message"""
-        for intent, patterns in self.intents.items():
-            for pattern in patterns:
-                if re.search(pattern, message, re.IGNORECASE):
-                    return intent
+        for intent, pattern in self._intent_patterns:
+            if pattern.search(message):
+                return intent
         return "general"
     
     def _handle_balance_inquiry(self, message: str, features: FeatureEngineering) -> tuple:
@@ -195,8 +228,8 @@ class ChatbotService:
             type_name = self._translate_anomaly_type(anomaly_type)
             response += f"{type_name}: {len(group_anomalies)} trường hợp\n"
             
-            # Show top 2 most confident
-            top_anomalies = sorted(group_anomalies, key=lambda x: x.confidence_score, reverse=True)[:2]
+            # Show top 2 most confident (partial selection, no full sort)
+            top_anomalies = heapq.nlargest(2, group_anomalies, key=lambda x: x.confidence_score)
             for anomaly in top_anomalies:
                 response += f"  • {anomaly.description}\n"
         
@@ -220,20 +253,22 @@ class ChatbotService:
             response += f"Giờ giao dịch nhiều nhất: {', '.join(hours_str)}\n"
         
         # Recent activity
+        recent_cutoff = datetime.now() - timedelta(days=7)
         recent_txs = [
             tx for tx in transactions 
-            if tx.timestamp >= datetime.now() - timedelta(days=7)
+            if tx.timestamp >= recent_cutoff
         ]
         
         response += f"Giao dịch 7 ngày qua: {len(recent_txs)}\n"
         
         # Daily pattern
         if len(transactions) >= 14:  # At least 2 weeks of data
-            weekday_txs = [tx for tx in transactions if tx.timestamp.weekday() < 5]
-            weekend_txs = [tx for tx in transactions if tx.timestamp.weekday() >= 5]
+            # Single pass count; weekday count is the complement
+            weekend_count = sum(tx.timestamp.weekday() >= 5 for tx in transactions)
+            weekday_count = len(transactions) - weekend_count
             
-            weekday_avg = len(weekday_txs) / 5 if weekday_txs else 0
-            weekend_avg = len(weekend_txs) / 2 if weekend_txs else 0
+            weekday_avg = weekday_count / 5
+            weekend_avg = weekend_count / 2
             
             response += f"Trung bình ngày thường: {weekday_avg:.1f} giao dịch/ngày\n"
             response += f"Trung bình cuối tuần: {weekend_avg:.1f} giao dịch/ngày\n"
@@ -302,16 +337,7 @@ class ChatbotService:
     
     def _translate_anomaly_type(self, anomaly_type: str) -> str:
         """Translate anomaly type to Vietnamese"""
-        translations = {
-            "unusual_amount": "Số tiền bất thường",
-            "high_frequency": "Tần suất cao",
-            "unusual_time": "Thời gian bất thường",
-            "rapid_transactions": "Giao dịch liên tiếp",
-            "ml_detected": "Phát hiện bởi AI",
-            "round_number_bias": "Pattern số tròn",
-            "weekend_activity": "Hoạt động cuối tuần"
-        }
-        return translations.get(anomaly_type, anomaly_type)
+        return self.ANOMALY_TYPE_LABELS.get(anomaly_type, anomaly_type)
     
     def _generate_suggestions(
         self, 
@@ -321,36 +347,13 @@ class ChatbotService:
     ) -> List[str]:
         """Generate contextual suggestions"""
         
-        suggestions = []
-        
-        # Base suggestions
-        base_suggestions = [
-            "Số dư hiện tại của tôi",
-            "Có hoạt động bất thường nào không?",
-            "Tôi đã chi tiêu bao nhiêu tháng này?",
-            "Phân tích giao dịch của tôi"
-        ]
-        
         # Context-specific suggestions
-        if intent == "balance_inquiry":
-            suggestions.extend([
-                "Biến động số dư như thế nào?",
-                "So sánh với tháng trước"
-            ])
-        elif intent == "anomaly_check":
-            suggestions.extend([
-                "Làm sao để bảo mật tài khoản?",
-                "Cách thiết lập cảnh báo"
-            ])
-        elif len(transactions) > 50:
-            suggestions.extend([
-                "Xu hướng giao dịch của tôi",
-                "Địa chỉ tôi gửi tiền nhiều nhất"
-            ])
-        
-        # Combine and limit
-        all_suggestions = base_suggestions + suggestions
-        return all_suggestions[:5]  # Limit to 5 suggestions
+        extra = self.INTENT_SUGGESTIONS.get(intent)
+        if extra is None:
+            extra = self.ACTIVE_USER_SUGGESTIONS if len(transactions) > 50 else ()
+        
+        # Combine and limit to 5 suggestions
+        return list((self.BASE_SUGGESTIONS + extra)[:5])
 
 # Singleton instance
 chatbot_service = ChatbotService()
@@ -5,23 +5,108 @@ Trợ lý AI thông minh với Gemini LLM support
 
 import re
 import json
-from typing import List, Dict, Any, Optional
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from string import Template
+from typing import List, Dict, Any, Optional, AsyncIterator
 from datetime import datetime, timedelta
-import google.generativeai as genai
 from core.config import settings
 from models.schemas import (
     TransactionRecord, FeatureEngineering, AnomalyDetection,
     ChatbotRequest, ChatbotResponse
 )
 
+# Các field trong context thực sự gửi cho LLM; còn lại chỉ dùng cho rule-based/response data
+LLM_CONTEXT_FIELDS = {
+    "account_summary": ("total_transactions", "monthly_avg", "recent_activity",
+                        "total_spending", "avg_spending", "spending_by_asset"),
+    "risk_analysis": ("risk_score", "anomaly_count", "high_risk_anomalies"),
+    "behavioral_insights": ("peak_hours", "frequent_destinations", "debt_ratio", "refund_frequency"),
+    "savings_analysis": ("suggestions", "potential_savings"),
+    "balance_info": ("current_balances", "volatility"),
+}
+
+def _round_floats(value: Any) -> Any:
+    """Làm tròn float (kể cả trong dict/list) để prompt ngắn hơn"""
+    if isinstance(value, float):
+        return round(value, 2)
+    if isinstance(value, dict):
+        return {k: _round_floats(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round_floats(v) for v in value]
+    return value
+
 class EnhancedChatbotService:
     """AI Assistant với LLM integration"""
     
+    # System prompt for financial analysis
+    SYSTEM_PROMPT = """
+Bạn là một trợ lý tài chính thông minh cho ví blockchain UnityWallet. 
+Nhiệm vụ của bạn:
+1. Phân tích dữ liệu giao dịch và đưa ra insights hữu ích
+2. Gợi ý tiết kiệm và quản lý tài chính
+3. Cảnh báo về các hoạt động bất thường
+4. Trả lời bằng tiếng Việt thân thiện và dễ hiểu
+
+Quy tắc:
+- Luôn dựa trên dữ liệu thực tế được cung cấp
+- Đưa ra lời khuyên thực tế và có thể thực hiện
+- Giữ bảo mật thông tin cá nhân (mask địa chỉ)
+- Sử dụng emoji phù hợp để tăng tính thân thiện
+"""
+    
+    # Prompt gửi Gemini; chỉ context và câu hỏi thay đổi theo request
+    PROMPT_TEMPLATE = Template("""
+""" + SYSTEM_PROMPT + """
+
+Dữ liệu tài khoản người dùng:
+$context
+
+Câu hỏi của người dùng: $message
+
+Hãy phân tích và trả lời một cách thông minh, đưa ra insights và suggestions phù hợp. Trả lời bằng tiếng Việt.
+""")
+    
+    # Rule-based response templates (fallback khi không dùng Gemini)
+    RISK_LEVELS = ((0.3, "✅", "AN TOÀN"), (0.7, "⚠️", "CẦN CHÚ Ý"), (float("inf"), "🚨", "NGUY HIỂM"))
+    RISK_TEMPLATE = (
+        "{emoji} **Đánh giá rủi ro: {status}**\n\n"
+        "📊 Điểm rủi ro: {risk_score:.2f}/1.0\n"
+        "🔍 Phát hiện: {anomaly_count} hoạt động bất thường\n\n"
+    )
+    ACTIVITY_TEMPLATE = (
+        "📊 **Tổng quan hoạt động:**\n\n"
+        "• Tổng giao dịch: {total_txs}\n"
+        "• Trung bình/tháng: {monthly_avg:.1f}\n"
+        "• Hoạt động 7 ngày qua: {recent_activity}\n\n"
+    )
+    GENERAL_TEMPLATE = (
+        "🤖 **Tóm tắt tài khoản của bạn:**\n\n"
+        "💼 Tổng giao dịch: {total_transactions}\n"
+        "📊 Điểm rủi ro: {risk_score:.2f}/1.0\n"
+        "💰 Tổng chi tiêu: {total_spending:.2f}\n\n"
+        "💡 **Hỏi tôi về:**\n"
+        "• Số dư và tài sản\n"
+        "• Gợi ý tiết kiệm\n"
+        "• Phân tích rủi ro\n"
+        "• Thói quen giao dịch"
+    )
+    
     def __init__(self):
         self.context_cache = {}
+        # In-flight Gemini calls keyed by prompt hash, so identical concurrent
+        # questions share a single upstream request
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # LRU + TTL cache of Gemini answers keyed by prompt hash
+        self._response_cache: "OrderedDict[str, tuple]" = OrderedDict()
         
         # Configure Gemini
         if settings.use_gemini and settings.gemini_api_key:
+            # Imported only when Gemini is enabled; the SDK (grpc/protobuf) is slow to import
+            import google.generativeai as genai
             genai.configure(api_key=settings.gemini_api_key)
             self.gemini_model = genai.GenerativeModel(settings.gemini_model)
             self.use_gemini = True
@@ -31,22 +116,6 @@ class EnhancedChatbotService:
         
         if not self.use_gemini:
             print("Warning: No Gemini API key found, using rule-based responses")
-        
-        # System prompt for financial analysis
-        self.system_prompt = """
-Bạn là một trợ lý tài chính thông minh cho ví blockchain UnityWallet. 
-Nhiệm vụ của bạn:
-1. Phân tích dữ liệu giao dịch và đưa ra insights hữu ích
-2. Gợi ý tiết kiệm và quản lý tài chính
-3. Cảnh báo về các hoạt động bất thường
-4. Trả lời bằng tiếng Việt thân thiện và dễ hiểu
-
-Quy tắc:
-- Luôn dựa trên dữ liệu thực tế được cung cấp
-- Đưa ra lời khuyên thực tế và có thể thực hiện
-- Giữ bảo mật thông tin cá nhân (mask địa chỉ)
-- Sử dụng emoji phù hợp để tăng tính thân thiện
-"""
     
     async def process_message(
         self, 
@@ -57,6 +126,13 @@ Quy tắc:
     ) -> ChatbotResponse:
         """Xử lý tin nhắn với LLM hoặc rule-based"""
         
+        # No history: every intent gives the same answer, skip context + LLM
+        if not transactions:
+            return ChatbotResponse(
+                response="Chưa có dữ liệu giao dịch để phân tích.",
+                suggestions=[]
+            )
+        
         # Prepare context data
         context_data = self._prepare_context(transactions, features, anomalies)
         
@@ -81,43 +157,42 @@ Quy tắc:
     ) -> Dict[str, Any]:
         """Chuẩn bị context data cho LLM"""
         
-        # Calculate additional insights
-        recent_txs = [
-            tx for tx in transactions 
-            if tx.timestamp >= datetime.now() - timedelta(days=7)
-        ]
-        
-        outgoing_txs = [
-            tx for tx in transactions 
-            if tx.source == features.account and tx.amount
-        ]
+        # Calculate additional insights in a single pass over transactions
+        recent_cutoff = datetime.now() - timedelta(days=7)
+        recent_count = 0
+        outgoing_count = 0
+        weekend_outgoing_count = 0
+        total_spending = 0
+        spending_by_asset = {}
         
-        incoming_txs = [
-            tx for tx in transactions 
-            if tx.destination == features.account and tx.amount
-        ]
+        for tx in transactions:
+            if tx.timestamp >= recent_cutoff:
+                recent_count += 1
+            if tx.source == features.account and tx.amount:
+                outgoing_count += 1
+                total_spending += tx.amount
+                if tx.timestamp.weekday() >= 5:
+                    weekend_outgoing_count += 1
+                # Asset analysis
+                asset = str(tx.asset) if tx.asset else "XLM"
+                spending_by_asset[asset] = spending_by_asset.get(asset, 0) + tx.amount
         
         # Spending pattern analysis
-        total_spending = sum(tx.amount for tx in outgoing_txs)
-        avg_spending_per_tx = total_spending / len(outgoing_txs) if outgoing_txs else 0
-        
-        # Asset analysis
-        spending_by_asset = {}
-        for tx in outgoing_txs:
-            asset = str(tx.asset) if tx.asset else "XLM"
-            spending_by_asset[asset] = spending_by_asset.get(asset, 0) + tx.amount
+        avg_spending_per_tx = total_spending / outgoing_count if outgoing_count else 0
         
         # Risk assessment
         risk_score = self._calculate_risk_score(features, anomalies)
         
         # Savings potential
-        savings_suggestions = self._analyze_savings_potential(features, transactions)
+        savings_suggestions = self._analyze_savings_potential(
+            features, total_spending, outgoing_count, weekend_outgoing_count
+        )
         
         return {
             "account_summary": {
                 "total_transactions": features.total_transactions,
                 "monthly_avg": features.transactions_per_month,
-                "recent_activity": len(recent_txs),
+                "recent_activity": recent_count,
                 "total_spending": total_spending,
                 "avg_spending": avg_spending_per_tx,
                 "spending_by_asset": spending_by_asset
@@ -140,31 +215,161 @@ Quy tắc:
             }
         }
     
+    async def stream_message(
+        self,
+        request: ChatbotRequest,
+        transactions: List[TransactionRecord],
+        features: FeatureEngineering,
+        anomalies: List[AnomalyDetection]
+    ) -> AsyncIterator[str]:
+        """Xử lý tin nhắn và trả về câu trả lời theo từng đoạn"""
+        
+        if not transactions:
+            yield "Chưa có dữ liệu giao dịch để phân tích."
+            return
+        
+        context_data = self._prepare_context(transactions, features, anomalies)
+        
+        if not self.use_gemini:
+            yield self._process_with_rules(request.message, context_data)
+            return
+        
+        context_json = self._serialize_context(context_data)
+        key = self._prompt_key(request.message, context_json)
+        cached = self._get_cached_response(key)
+        if cached is not None:
+            yield cached
+            return
+        
+        prompt = self._build_prompt(request.message, context_json)
+        chunks = []
+        try:
+            response = await self.gemini_model.generate_content_async(prompt, stream=True)
+            async for chunk in response:
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    yield chunk.text
+        except Exception as e:
+            print(f"Gemini LLM Error: {e}")
+            if not chunks:
+                yield self._process_with_rules(request.message, context_data)
+            return
+        
+        self._store_cached_response(key, "".join(chunks).strip(), self._response_ttl(request.message))
+    
+    @staticmethod
+    def _prune_context(context_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Giữ lại các field LLM cần, rút gọn anomalies thành type/description/confidence"""
+        pruned = {}
+        for section, fields in LLM_CONTEXT_FIELDS.items():
+            data = context_data.get(section)
+            if data:
+                pruned[section] = _round_floats({f: data[f] for f in fields if f in data})
+        
+        risk = pruned.get("risk_analysis")
+        if risk and "high_risk_anomalies" in risk:
+            risk["high_risk_anomalies"] = [
+                {
+                    "type": a.anomaly_type,
+                    "description": a.description,
+                    "confidence": round(a.confidence_score, 2)
+                }
+                for a in risk["high_risk_anomalies"][:5]
+            ]
+        return pruned
+    
+    @classmethod
+    def _serialize_context(cls, context_data: Dict[str, Any]) -> str:
+        """Serialize context (đã prune, compact) một lần, dùng chung cho cache key và prompt"""
+        return json.dumps(
+            cls._prune_context(context_data),
+            ensure_ascii=False, separators=(",", ":"), default=str
+        )
+    
+    def _build_prompt(self, message: str, context_summary: str) -> str:
+        """Ghép context đã serialize và câu hỏi vào prompt template"""
+        return self.PROMPT_TEMPLATE.safe_substitute(context=context_summary, message=message)
+    
     async def _process_with_gemini(self, message: str, context_data: Dict[str, Any]) -> str:
         """Xử lý với Gemini LLM"""
         try:
-            # Prepare context for LLM
-            context_summary = json.dumps(context_data, indent=2, ensure_ascii=False, default=str)
-            
-            prompt = f"""
-{self.system_prompt}
-
-Dữ liệu tài khoản người dùng:
-{context_summary}
-
-Câu hỏi của người dùng: {message}
-
-Hãy phân tích và trả lời một cách thông minh, đưa ra insights và suggestions phù hợp. Trả lời bằng tiếng Việt.
-"""
+            context_json = self._serialize_context(context_data)
+            key = self._prompt_key(message, context_json)
+            cached = self._get_cached_response(key)
+            if cached is not None:
+                return cached
             
-            response = self.gemini_model.generate_content(prompt)
-            return response.text.strip()
+            prompt = self._build_prompt(message, context_json)
+            text = await self._generate_coalesced(key, prompt)
+            self._store_cached_response(key, text, self._response_ttl(message))
+            return text
             
         except Exception as e:
             print(f"Gemini LLM Error: {e}")
             return self._process_with_rules(message, context_data)
     
 
+    @staticmethod
+    def _prompt_key(message: str, context_json: str) -> str:
+        payload = f"{message}\x00{context_json}".encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+    
+    @staticmethod
+    def _response_ttl(message: str) -> int:
+        """Câu hỏi về rủi ro cần dữ liệu mới hơn câu hỏi tổng quan"""
+        message_lower = message.lower()
+        if any(word in message_lower for word in ["bất thường", "nguy hiểm", "rủi ro", "risk", "anomaly"]):
+            return 60
+        return settings.cache_ttl_seconds
+    
+    def _get_cached_response(self, key: str) -> Optional[str]:
+        entry = self._response_cache.get(key)
+        if entry is None:
+            return None
+        text, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._response_cache[key]
+            return None
+        self._response_cache.move_to_end(key)
+        return text
+    
+    def _store_cached_response(self, key: str, text: str, ttl: int) -> None:
+        self._response_cache[key] = (text, time.monotonic() + ttl)
+        self._response_cache.move_to_end(key)
+        while len(self._response_cache) > settings.cache_max_size:
+            self._response_cache.popitem(last=False)
+    
+    async def _generate_coalesced(self, key: str, prompt: str) -> str:
+        """Gọi Gemini, gộp các request trùng prompt đang chạy đồng thời"""
+        pending = self._inflight.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # Only re-raise our own cancellation; if the leading request was cancelled
+                # (its caller went away), generate again instead of failing this caller
+                task = asyncio.current_task()
+                if not pending.cancelled() or (hasattr(task, "cancelling") and task.cancelling()):
+                    raise
+            return await self._generate_coalesced(key, prompt)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response = await self.gemini_model.generate_content_async(prompt)
+            text = response.text.strip()
+            future.set_result(text)
+            return text
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so a lone caller doesn't trigger "never retrieved" warnings
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+    
     def _process_with_rules(self, message: str, context_data: Dict[str, Any]) -> str:
         """Fallback rule-based processing"""
         
@@ -197,12 +402,12 @@ Hãy phân tích và trả lời một cách thông minh, đưa ra insights và
         if not balances:
             return "💰 Tôi không thể truy cập thông tin số dư hiện tại. Hãy kiểm tra kết nối với blockchain."
         
-        response = "💰 **Thông tin số dư của bạn:**\n\n"
-        
+        lines = []
         for asset, balance in balances.items():
             vol = volatility.get(asset, 0)
             vol_status = "📈 cao" if vol > 100 else "📊 ổn định" if vol > 10 else "📉 thấp"
-            response += f"• {asset}: {balance:.2f} (biến động {vol_status})\n"
+            lines.append(f"• {asset}: {balance:.2f} (biến động {vol_status})\n")
+        response = "💰 **Thông tin số dư của bạn:**\n\n" + "".join(lines)
         
         # Add insights
         if len(balances) > 1:
@@ -216,10 +421,9 @@ Hãy phân tích và trả lời một cách thông minh, đưa ra insights và
         if not savings_analysis["has_potential"]:
             return "💚 Tuyệt vời! Thói quen chi tiêu của bạn đã khá tối ưu. Hãy duy trì như vậy!"
         
-        response = "💡 **Gợi ý tiết kiệm cho bạn:**\n\n"
-        
-        for suggestion in savings_analysis["suggestions"]:
-            response += f"• {suggestion}\n"
+        response = "💡 **Gợi ý tiết kiệm cho bạn:**\n\n" + "".join(
+            f"• {suggestion}\n" for suggestion in savings_analysis["suggestions"]
+        )
         
         if savings_analysis["potential_savings"] > 0:
             response += f"\n📊 Tiềm năng tiết kiệm: ~{savings_analysis['potential_savings']:.2f} XLM/tháng"
@@ -232,24 +436,21 @@ Hãy phân tích và trả lời một cách thông minh, đưa ra insights và
         risk_score = risk_analysis["risk_score"]
         anomaly_count = risk_analysis["anomaly_count"]
         
-        if risk_score < 0.3:
-            status_emoji = "✅"
-            status_text = "AN TOÀN"
-        elif risk_score < 0.7:
-            status_emoji = "⚠️"
-            status_text = "CẦN CHÚ Ý"
-        else:
-            status_emoji = "🚨"
-            status_text = "NGUY HIỂM"
+        status_emoji, status_text = next(
+            ((emoji, text) for limit, emoji, text in self.RISK_LEVELS if risk_score < limit),
+            self.RISK_LEVELS[-1][1:]
+        )
         
-        response = f"{status_emoji} **Đánh giá rủi ro: {status_text}**\n\n"
-        response += f"📊 Điểm rủi ro: {risk_score:.2f}/1.0\n"
-        response += f"🔍 Phát hiện: {anomaly_count} hoạt động bất thường\n\n"
+        response = self.RISK_TEMPLATE.format(
+            emoji=status_emoji, status=status_text,
+            risk_score=risk_score, anomaly_count=anomaly_count
+        )
         
         if risk_analysis["high_risk_anomalies"]:
-            response += "🚨 **Cảnh báo quan trọng:**\n"
-            for anomaly in risk_analysis["high_risk_anomalies"][:2]:
-                response += f"• {anomaly.description}\n"
+            response += "🚨 **Cảnh báo quan trọng:**\n" + "".join(
+                f"• {anomaly.description}\n"
+                for anomaly in risk_analysis["high_risk_anomalies"][:2]
+            )
         
         return response
     
@@ -260,10 +461,9 @@ Hãy phân tích và trả lời một cách thông minh, đưa ra insights và
         monthly_avg = account_summary["monthly_avg"]
         recent_activity = account_summary["recent_activity"]
         
-        response = f"📊 **Tổng quan hoạt động:**\n\n"
-        response += f"• Tổng giao dịch: {total_txs}\n"
-        response += f"• Trung bình/tháng: {monthly_avg:.1f}\n"
-        response += f"• Hoạt động 7 ngày qua: {recent_activity}\n\n"
+        response = self.ACTIVITY_TEMPLATE.format(
+            total_txs=total_txs, monthly_avg=monthly_avg, recent_activity=recent_activity
+        )
         
         # Activity level assessment
         if monthly_avg >= 30:
@@ -281,18 +481,11 @@ Hãy phân tích và trả lời một cách thông minh, đưa ra insights và
         account_summary = context_data["account_summary"]
         risk_analysis = context_data["risk_analysis"]
         
-        response = "🤖 **Tóm tắt tài khoản của bạn:**\n\n"
-        response += f"💼 Tổng giao dịch: {account_summary['total_transactions']}\n"
-        response += f"📊 Điểm rủi ro: {risk_analysis['risk_score']:.2f}/1.0\n"
-        response += f"💰 Tổng chi tiêu: {account_summary['total_spending']:.2f}\n\n"
-        
-        response += "💡 **Hỏi tôi về:**\n"
-        response += "• Số dư và tài sản\n"
-        response += "• Gợi ý tiết kiệm\n" 
-        response += "• Phân tích rủi ro\n"
-        response += "• Thói quen giao dịch"
-        
-        return response
+        return self.GENERAL_TEMPLATE.format(
+            total_transactions=account_summary["total_transactions"],
+            risk_score=risk_analysis["risk_score"],
+            total_spending=account_summary["total_spending"]
+        )
     
     def _calculate_risk_score(
         self, 
@@ -327,24 +520,20 @@ Hãy phân tích và trả lời một cách thông minh, đưa ra insights và
     def _analyze_savings_potential(
         self, 
         features: FeatureEngineering,
-        transactions: List[TransactionRecord]
+        total_spending: float,
+        outgoing_count: int,
+        weekend_outgoing_count: int
     ) -> Dict[str, Any]:
-        """Phân tích tiềm năng tiết kiệm"""
+        """Phân tích tiềm năng tiết kiệm từ tổng hợp chi tiêu đã tính trong _prepare_context"""
         
         suggestions = []
         potential_savings = 0.0
         
-        outgoing_txs = [
-            tx for tx in transactions 
-            if tx.source == features.account and tx.amount
-        ]
-        
-        if not outgoing_txs:
+        if not outgoing_count:
             return {"has_potential": False, "suggestions": [], "potential_savings": 0}
         
         # Analyze spending patterns
-        total_spending = sum(tx.amount for tx in outgoing_txs)
-        avg_tx_amount = total_spending / len(outgoing_txs)
+        avg_tx_amount = total_spending / outgoing_count
         
         # High frequency, small amounts -> consolidation opportunity
         if features.transactions_per_month > 30 and avg_tx_amount < 10:
@@ -352,12 +541,7 @@ Hãy phân tích và trả lời một cách thông minh, đưa ra insights và
             potential_savings += features.transactions_per_month * 0.1  # Estimate fee savings
         
         # Weekend/unusual hour activity
-        weekend_txs = [
-            tx for tx in outgoing_txs 
-            if tx.timestamp.weekday() >= 5
-        ]
-        
-        if len(weekend_txs) > len(outgoing_txs) * 0.3:
+        if weekend_outgoing_count > outgoing_count * 0.3:
             suggestions.append("📅 Lên kế hoạch giao dịch vào ngày thường để tránh chi tiêu bốc đồng")
         
         # Large transaction analysis
@@ -419,5 +603,8 @@ Hãy phân tích và trả lời một cách thông minh, đưa ra insights và
         
         return suggestions[:5]
 
-# Singleton instance
-enhanced_chatbot_service = EnhancedChatbotService()
+# Built lazily on first use (or at startup warmup) and shared per worker
+@lru_cache(maxsize=1)
+def get_enhanced_chatbot_service() -> EnhancedChatbotService:
+    """FastAPI dependency trả về instance EnhancedChatbotService dùng chung"""
+    return EnhancedChatbotService()
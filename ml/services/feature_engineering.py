@@ -8,10 +8,30 @@ import pandas as pd
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
+from types import MappingProxyType
 from models.schemas import (
     TransactionRecord, FeatureEngineering, WalletBalance, AssetInfo
 )
 
+# Giá trị mặc định khi không có data; pydantic tạo dict/list mới khi validate
+EMPTY_FEATURE_VALUES = MappingProxyType({
+    "total_transactions": 0,
+    "transactions_per_month": 0.0,
+    "payment_count": 0,
+    "swap_count": 0,
+    "balance_volatility": {},
+    "max_balance": {},
+    "min_balance": {},
+    "avg_balance": {},
+    "debt_to_asset_ratio": None,
+    "refund_frequency": 0.0,
+    "refund_amount_ratio": 0.0,
+    "peak_transaction_hours": [],
+    "frequent_destinations": [],
+    "large_transaction_count": 0,
+    "large_transaction_threshold": 0.0
+})
+
 class FeatureEngineeringService:
     """Service tính toán các features từ transaction history"""
     
@@ -53,6 +73,10 @@ class FeatureEngineeringService:
         else:
             df_period = df
         
+        # Computed once and shared by the fields that need them
+        refund_frequency = self._calculate_refund_frequency(df_period)
+        large_transaction_count, large_transaction_threshold = self._count_large_transactions(df_period)
+        
         features = FeatureEngineering(
             account=account,
             period_start=period_start,
@@ -74,16 +98,16 @@ class FeatureEngineeringService:
             debt_to_asset_ratio=self._calculate_debt_ratio(df_period, balances),
             
             # Refund patterns
-            refund_frequency=self._calculate_refund_frequency(df_period),
-            refund_amount_ratio=self._calculate_refund_amount_ratio(df_period),
+            refund_frequency=refund_frequency,
+            refund_amount_ratio=self._calculate_refund_amount_ratio(df_period, refund_frequency),
             
             # Transaction patterns
             peak_transaction_hours=self._find_peak_hours(df_period),
             frequent_destinations=self._find_frequent_destinations(df_period),
             
             # Risk metrics
-            large_transaction_count=self._count_large_transactions(df_period)[0],
-            large_transaction_threshold=self._count_large_transactions(df_period)[1]
+            large_transaction_count=large_transaction_count,
+            large_transaction_threshold=large_transaction_threshold
         )
         
         return features
@@ -137,27 +161,26 @@ class FeatureEngineeringService:
         balances: List[WalletBalance]
     ) -> Dict[str, float]:
         """Tính độ biến động số dư cho mỗi asset"""
-        volatility = {}
-        
-        # Group transactions by asset
-        for asset_code in df['asset_code'].unique():
-            asset_txs = df[df['asset_code'] == asset_code]
-            if len(asset_txs) < 2:
-                volatility[asset_code] = 0.0
-                continue
-            
-            # Simulate balance changes over time
-            balance_changes = []
-            for _, tx in asset_txs.iterrows():
-                if tx['is_outgoing'] and tx['amount'] > 0:
-                    balance_changes.append(-tx['amount'])
-                elif tx['is_incoming'] and tx['amount'] > 0:
-                    balance_changes.append(tx['amount'])
-            
-            if balance_changes:
-                volatility[asset_code] = float(np.std(balance_changes))
-            else:
-                volatility[asset_code] = 0.0
+        if df.empty:
+            return {}
+        
+        # Signed balance change per row: outgoing trừ, incoming cộng, còn lại bỏ qua (NaN)
+        amounts = df['amount'].to_numpy(dtype=np.float64)
+        positive = amounts > 0
+        changes = np.where(
+            df['is_outgoing'].to_numpy(dtype=bool) & positive, -amounts,
+            np.where(df['is_incoming'].to_numpy(dtype=bool) & positive, amounts, np.nan)
+        )
+        
+        # One groupby per asset instead of a filter + iterrows per asset
+        grouped = pd.Series(changes, index=df.index).groupby(df['asset_code'], sort=False)
+        stds = grouped.std(ddof=0).fillna(0.0)
+        sizes = grouped.size()
+        
+        volatility = {
+            asset_code: float(stds[asset_code]) if sizes[asset_code] >= 2 else 0.0
+            for asset_code in sizes.index
+        }
         
         return volatility
     
@@ -201,38 +224,41 @@ class FeatureEngineeringService:
             return 0.0
         
         # Tìm các cặp giao dịch có thể là refund
-        refund_count = 0
-        total_outgoing = len(df[df['is_outgoing']])
+        outgoing_mask = df['is_outgoing'].to_numpy(dtype=bool)
+        total_outgoing = int(outgoing_mask.sum())
         
         if total_outgoing == 0:
             return 0.0
         
         # Logic đơn giản: tìm giao dịch có số tiền gần giống nhau trong khoảng thời gian ngắn
-        outgoing_txs = df[df['is_outgoing']].sort_values('timestamp')
         incoming_txs = df[df['is_incoming']].sort_values('timestamp')
+        in_times = incoming_txs['timestamp'].to_numpy(dtype='datetime64[ns]')
+        in_amounts = incoming_txs['amount'].to_numpy(dtype=np.float64)
+        out_times = df['timestamp'].to_numpy(dtype='datetime64[ns]')[outgoing_mask]
+        out_amounts = df['amount'].to_numpy(dtype=np.float64)[outgoing_mask]
         
-        for _, out_tx in outgoing_txs.iterrows():
-            # Tìm incoming transaction trong vòng 24h có số tiền tương tự
-            time_window = timedelta(hours=24)
-            similar_incoming = incoming_txs[
-                (incoming_txs['timestamp'] >= out_tx['timestamp']) &
-                (incoming_txs['timestamp'] <= out_tx['timestamp'] + time_window) &
-                (abs(incoming_txs['amount'] - out_tx['amount']) / out_tx['amount'] < 0.01)  # 1% tolerance
-            ]
-            
-            if not similar_incoming.empty:
-                refund_count += 1
+        # Incoming transactions trong vòng 24h sau mỗi outgoing: [lo, hi) trên mảng đã sort
+        lo = np.searchsorted(in_times, out_times, side='left')
+        hi = np.searchsorted(in_times, out_times + np.timedelta64(24, 'h'), side='right')
+        
+        refund_count = 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in np.flatnonzero(hi > lo):
+                # 1% tolerance on amount
+                if (np.abs(in_amounts[lo[i]:hi[i]] - out_amounts[i]) / out_amounts[i] < 0.01).any():
+                    refund_count += 1
         
         return refund_count / total_outgoing
     
-    def _calculate_refund_amount_ratio(self, df: pd.DataFrame) -> float:
+    def _calculate_refund_amount_ratio(self, df: pd.DataFrame, refund_frequency: Optional[float] = None) -> float:
         """Tính tỷ lệ số tiền được hoàn so với tổng chi tiêu"""
         total_outgoing = df[df['is_outgoing']]['amount'].sum()
         if total_outgoing == 0:
             return 0.0
         
         # Simplified - trong thực tế cần logic phức tạp hơn để detect refunds
-        refund_frequency = self._calculate_refund_frequency(df)
+        if refund_frequency is None:
+            refund_frequency = self._calculate_refund_frequency(df)
         estimated_refund_amount = total_outgoing * refund_frequency * 0.5  # Estimate
         
         return estimated_refund_amount / total_outgoing
@@ -242,9 +268,11 @@ class FeatureEngineeringService:
         if df.empty:
             return []
         
-        hour_counts = df['hour'].value_counts()
-        # Trả về top 3 giờ
-        return hour_counts.head(3).index.tolist()
+        # Đếm theo 24 bucket giờ trong một lần quét
+        hour_counts = np.bincount(df['hour'].to_numpy(dtype=np.int64), minlength=24)
+        # Trả về top 3 giờ; khi bằng nhau thì giờ sớm hơn đứng trước
+        top_hours = np.argsort(-hour_counts, kind='stable')[:3]
+        return [int(h) for h in top_hours if hour_counts[h] > 0]
     
     def _find_frequent_destinations(self, df: pd.DataFrame, top_n: int = 5) -> List[str]:
         """Tìm các địa chỉ gửi tiền thường xuyên nhất"""
@@ -272,25 +300,12 @@ class FeatureEngineeringService:
     
     def _empty_features(self, account: str) -> FeatureEngineering:
         """Trả về features rỗng khi không có data"""
+        period_end = datetime.now()
         return FeatureEngineering(
             account=account,
-            period_start=datetime.now() - timedelta(days=90),
-            period_end=datetime.now(),
-            total_transactions=0,
-            transactions_per_month=0.0,
-            payment_count=0,
-            swap_count=0,
-            balance_volatility={},
-            max_balance={},
-            min_balance={},
-            avg_balance={},
-            debt_to_asset_ratio=None,
-            refund_frequency=0.0,
-            refund_amount_ratio=0.0,
-            peak_transaction_hours=[],
-            frequent_destinations=[],
-            large_transaction_count=0,
-            large_transaction_threshold=0.0
+            period_start=period_end - timedelta(days=90),
+            period_end=period_end,
+            **EMPTY_FEATURE_VALUES
         )
 
 # Singleton instance
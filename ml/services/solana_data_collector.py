@@ -80,6 +80,12 @@ class SolanaDataCollector:
         transactions = []
         before = None
         
+        # Filter window - include future timestamps (Solana devnet may have future times)
+        from datetime import timezone
+        now = datetime.now(timezone.utc)
+        cutoff_date = now - timedelta(days=days_back)
+        future_cutoff = now + timedelta(days=365)  # Allow up to 1 year future
+        
         try:
             while len(transactions) < max_records:
                 # Lấy batch giao dịch
@@ -97,11 +103,6 @@ class SolanaDataCollector:
                 for tx in batch_transactions:
                     transaction_record = self._parse_solana_transaction(tx, account)
                     if transaction_record:
-                        # Filter by date - include future timestamps (Solana devnet may have future times)
-                        from datetime import timezone
-                        cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_back)
-                        future_cutoff = datetime.now(timezone.utc) + timedelta(days=365)  # Allow up to 1 year future
-                        
                         if transaction_record.timestamp >= cutoff_date and transaction_record.timestamp <= future_cutoff:
                             transactions.append(transaction_record)
                         elif transaction_record.timestamp < cutoff_date:
@@ -164,6 +165,13 @@ class SolanaDataCollector:
             print(f"Error parsing Solana transaction: {e}")
             return None
     
+    async def warmup(self):
+        """Mở sẵn kết nối keep-alive tới Chain API để request đầu tiên không phải handshake"""
+        try:
+            await self.client.get(f"{self.chain_url}/health", timeout=5.0)
+        except httpx.HTTPError as e:
+            print(f"⚠️ Chain API warmup failed: {e}")
+    
     async def close(self):
         """Đóng HTTP client"""
         await self.client.aclose()
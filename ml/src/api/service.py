@@ -3,12 +3,17 @@ ML API Service
 Tích hợp tất cả các models ML cho Unity Wallet
 """
 
+import os
 import json
 import asyncio
-from datetime import datetime
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 import pandas as pd
 import numpy as np
@@ -31,6 +36,22 @@ from models.anomaly import AnomalyDetector
 from rules.insights import InsightsEngine
 
 
+_ts_cache = [0, ""]
+
+def iso_timestamp() -> str:
+    """ISO timestamp cached per second; response metadata does not need microsecond precision"""
+    now = int(time.time())
+    if now != _ts_cache[0]:
+        _ts_cache[1] = datetime.fromtimestamp(now).isoformat()
+        _ts_cache[0] = now
+    return _ts_cache[1]
+
+
+def utc_timestamp() -> str:
+    """Naive UTC ISO timestamp, the default date for transactions sent without one"""
+    return datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+
+
 # Pydantic models for API
 class TransactionRequest(BaseModel):
     transaction_id: str
@@ -41,6 +62,7 @@ class TransactionRequest(BaseModel):
     location: str = "Ho Chi Minh City"
     transaction_date: Optional[str] = None
     description: Optional[str] = None
+    category: Optional[str] = None  # Known category skips the spend classifier
 
 class CreditScoreRequest(BaseModel):
     user_id: str
@@ -69,6 +91,44 @@ class AnalyticsResponse(BaseModel):
     timestamp: str
 
 
+def convert_numpy_types(obj: Any) -> Any:
+    """Convert numpy scalars/arrays nested in dicts/lists to Python native types"""
+    if isinstance(obj, dict):
+        return {k: convert_numpy_types(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [convert_numpy_types(v) for v in obj]
+    if isinstance(obj, (np.generic, np.ndarray)):
+        # tolist() yields native int/float/bool for scalars and nested lists for arrays
+        return obj.tolist()
+    return obj
+
+
+def _load_model(model_cls, model_path: Path, **load_kwargs):
+    """Instantiate a model and load its saved state if the artifact exists"""
+    model = model_cls()
+    if model_path.exists():
+        model.load_model(model_path, **load_kwargs)
+    return model
+
+
+# Credit model input width (8 mapped features + 20 zero-filled training features)
+CREDIT_FEATURE_COUNT = 28
+
+# Credit score grade cut-offs and the labels for each bucket (D, C, B, A)
+CREDIT_GRADE_CUTOFFS = np.array([550, 650, 750])
+CREDIT_GRADES = ('D', 'C', 'B', 'A')
+CREDIT_RISKS = ('Very High', 'High', 'Medium', 'Low')
+
+# Spend classification micro-batching
+SPEND_BATCH_MAX = 64
+SPEND_BATCH_WINDOW_S = 0.005
+
+# Server-side rolling window of recent transactions for velocity checks.
+# Per process: with WORKERS > 1 each worker only sees the requests it served.
+RECENT_TXN_WINDOW = 100
+RECENT_TXN_MAX_USERS = 10000
+
+
 class MLService:
     """Main ML service orchestrator"""
     
@@ -81,30 +141,37 @@ class MLService:
         
         # Performance tracking
         self.request_count = 0
-        self.response_times = []
+        # Rolling window of the last 1000 requests; deque evicts oldest in O(1)
+        self.response_times = deque(maxlen=1000)
+        
+        # Blocking sklearn/pandas work runs here so the event loop keeps serving requests
+        self._executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+        
+        # Per-thread reused credit feature row; only the first 8 slots change per request
+        self._credit_local = threading.local()
+        
+        # detect_transaction_anomaly updates per-user alert history
+        self._anomaly_lock = threading.Lock()
+        
+        # user_id -> deque of recent transactions, LRU-bounded by user count
+        self._recent_txns: "OrderedDict[str, deque]" = OrderedDict()
+        
+        # Queue of (transaction, future) drained by _spend_batch_worker
+        self._spend_queue: Optional[asyncio.Queue] = None
+        self._spend_worker: Optional[asyncio.Task] = None
         
     async def load_models(self):
         """Load all ML models asynchronously"""
         try:
             logger.info("🔄 Loading ML models...")
             
-            # Load spend classifier
-            self.spend_classifier = SpendClassifier()
-            spend_model_path = MODELS_ROOT / "spend_classifier.joblib"
-            if spend_model_path.exists():
-                self.spend_classifier.load_model(spend_model_path)
-            
-            # Load credit scorer
-            self.credit_scorer = CreditScoreModel()
-            credit_model_path = MODELS_ROOT / "credit_score_model.joblib"
-            if credit_model_path.exists():
-                self.credit_scorer.load_model(credit_model_path)
-            
-            # Load anomaly detector
-            self.anomaly_detector = AnomalyDetector()
-            anomaly_model_path = MODELS_ROOT / "anomaly_detector.joblib"
-            if anomaly_model_path.exists():
-                self.anomaly_detector.load_model(anomaly_model_path)
+            # Load spend classifier, credit scorer and anomaly detector concurrently
+            # off the event loop; sklearn weight arrays are memory-mapped
+            self.spend_classifier, self.credit_scorer, self.anomaly_detector = await asyncio.gather(
+                asyncio.to_thread(_load_model, SpendClassifier, MODELS_ROOT / "spend_classifier.joblib", mmap_mode='r'),
+                asyncio.to_thread(_load_model, CreditScoreModel, MODELS_ROOT / "credit_score_model.joblib", mmap_mode='r'),
+                asyncio.to_thread(_load_model, AnomalyDetector, MODELS_ROOT / "anomaly_detector.joblib")
+            )
             
             # Load insights engine
             self.insights_engine = InsightsEngine()
@@ -116,27 +183,90 @@ class MLService:
             logger.error(f"❌ Error loading models: {e}")
             raise
     
+    def start_batching(self):
+        """Start the spend classification micro-batching worker"""
+        if self._spend_worker is None:
+            self._spend_queue = asyncio.Queue()
+            self._spend_worker = asyncio.create_task(self._spend_batch_worker())
+    
+    async def _spend_batch_worker(self):
+        """Gom các request phân loại chi tiêu đang chờ và chạy model một lần cho cả batch"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._spend_queue.get()]
+            
+            # Only wait for more when requests are already piling up, so a lone
+            # request at low load is classified immediately
+            if not self._spend_queue.empty():
+                deadline = loop.time() + SPEND_BATCH_WINDOW_S
+                while len(batch) < SPEND_BATCH_MAX:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._spend_queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+            
+            transactions = [txn for txn, _ in batch]
+            try:
+                results = await self._run_blocking(
+                    self.spend_classifier.predict_many,
+                    [txn.description or '' for txn in transactions],
+                    [txn.mcc_code or '' for txn in transactions],
+                    [txn.merchant_name for txn in transactions]
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+    
+    async def _run_blocking(self, fn, *args):
+        """Run a blocking model call in the worker thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+    
+    def _credit_scratch(self) -> np.ndarray:
+        """Feature row owned by the calling worker thread"""
+        scratch = getattr(self._credit_local, 'row', None)
+        if scratch is None:
+            scratch = self._credit_local.row = np.zeros((1, CREDIT_FEATURE_COUNT), dtype=np.float64)
+        return scratch
+    
+    def shutdown(self):
+        """Stop the batching worker and the thread pool"""
+        if self._spend_worker is not None:
+            self._spend_worker.cancel()
+            self._spend_worker = None
+        self._executor.shutdown(wait=False)
+    
     def track_performance(self, processing_time: float):
         """Track API performance metrics"""
         self.request_count += 1
         self.response_times.append(processing_time)
-        
-        # Keep only last 1000 requests for rolling metrics
-        if len(self.response_times) > 1000:
-            self.response_times = self.response_times[-1000:]
     
     def get_performance_stats(self) -> Dict[str, float]:
         """Get current performance statistics"""
         if not self.response_times:
             return {}
         
+        n = len(self.response_times)
+        times = np.fromiter(self.response_times, dtype=np.float64, count=n)
+        p95_idx, p99_idx = int(0.95 * n), int(0.99 * n)
+        # O(n) selection of both percentiles instead of two full sorts
+        selected = np.partition(times, [p95_idx, p99_idx])
+        
         return {
             'total_requests': self.request_count,
-            'avg_response_time_ms': sum(self.response_times) / len(self.response_times),
-            'p95_response_time_ms': sorted(self.response_times)[int(0.95 * len(self.response_times))],
-            'p99_response_time_ms': sorted(self.response_times)[int(0.99 * len(self.response_times))],
-            'min_response_time_ms': min(self.response_times),
-            'max_response_time_ms': max(self.response_times)
+            'avg_response_time_ms': float(times.mean()),
+            'p95_response_time_ms': float(selected[p95_idx]),
+            'p99_response_time_ms': float(selected[p99_idx]),
+            'min_response_time_ms': float(times.min()),
+            'max_response_time_ms': float(times.max())
         }
     
     async def classify_spend(self, transaction: TransactionRequest) -> Dict[str, Any]:
@@ -144,12 +274,18 @@ class MLService:
         if not self.models_loaded or not self.spend_classifier:
             raise HTTPException(status_code=503, detail="Spend classifier not available")
         
-        # Classify
-        result = self.spend_classifier.predict(
-            description=transaction.description or '',
-            mcc=transaction.mcc_code or '',
-            merchant_name=transaction.merchant_name
-        )
+        # Classify, through the micro-batcher when it is running
+        if self._spend_worker is not None:
+            future = asyncio.get_running_loop().create_future()
+            await self._spend_queue.put((transaction, future))
+            result = await future
+        else:
+            result = await self._run_blocking(
+                self.spend_classifier.predict,
+                transaction.description or '',
+                transaction.mcc_code or '',
+                transaction.merchant_name
+            )
         
         return {
             'transaction_id': transaction.transaction_id,
@@ -165,118 +301,134 @@ class MLService:
         if not self.models_loaded or not self.credit_scorer:
             raise HTTPException(status_code=503, detail="Credit scorer not available")
         
-        # For API, we'll create a simplified prediction method
-        # Create feature vector from user features
-        try:
-            # Map API features to model features
-            feature_mapping = {
-                'age': request.user_features.get('age', 30),
-                'income': request.user_features.get('monthly_income', request.user_features.get('income', 15000000)),
-                'total_transactions': request.user_features.get('total_transactions', 50),
-                'avg_transaction_amount': request.user_features.get('avg_transaction_amount', 300000),
-                'account_age_months': request.user_features.get('account_age_months', 12),
-                'savings_balance': request.user_features.get('savings_balance', 10000000),
-                'loan_history': request.user_features.get('loan_history', 0),
-                'credit_utilization': request.user_features.get('credit_utilization', 0.5)
-            }
-            
-            # Create feature vector in the order expected by model
-            X = np.array([
-                feature_mapping['age'],
-                feature_mapping['income'],
-                feature_mapping['total_transactions'],
-                feature_mapping['avg_transaction_amount'],
-                feature_mapping['account_age_months'],
-                feature_mapping['savings_balance'],
-                feature_mapping['loan_history'],
-                feature_mapping['credit_utilization'],
-                # Add other default features to match model training
-                0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0,  # 10 more features
-                0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0   # 10 more features
-            ]).reshape(1, -1)
-            
-            # Scale features
-            X_scaled = self.credit_scorer.scaler.transform(X)
-            
-            # Predict
-            prob_good_credit = self.credit_scorer.calibrated_model.predict_proba(X_scaled)[0, 1]
-            
-            # Enhanced scoring for demo - boost high income users
-            income = feature_mapping['income']
-            savings = feature_mapping['savings_balance'] 
-            debt_ratio = request.user_features.get('existing_debt', 0) / income if income > 0 else 1
-            
-            # Income boost
-            if income >= 50000000:  # 50M+ income
-                prob_good_credit = max(prob_good_credit, 0.85)
-            elif income >= 25000000:  # 25M+ income
-                prob_good_credit = max(prob_good_credit, 0.70)
-            elif income >= 15000000:  # 15M+ income
-                prob_good_credit = max(prob_good_credit, 0.50)
-            
-            # Savings boost
-            if savings >= income * 10:  # 10+ months income in savings
-                prob_good_credit = min(1.0, prob_good_credit + 0.15)
-            elif savings >= income * 5:  # 5+ months income
-                prob_good_credit = min(1.0, prob_good_credit + 0.08)
-            
-            # Debt penalty
-            if debt_ratio > 0.8:
-                prob_good_credit = max(0.1, prob_good_credit - 0.3)
-            elif debt_ratio > 0.5:
-                prob_good_credit = max(0.2, prob_good_credit - 0.15)
-            
-            # Convert to credit score (300-850 range)
-            credit_score = int(300 + (prob_good_credit * 550))
-            
-            # Determine grade
-            if credit_score >= 750:
-                grade = 'A'
-                risk = 'Low'
-            elif credit_score >= 650:
-                grade = 'B'
-                risk = 'Medium'
-            elif credit_score >= 550:
-                grade = 'C'
-                risk = 'High'
-            else:
-                grade = 'D'
-                risk = 'Very High'
-            
+        return await self._run_blocking(self._score_credit_sync, request)
+    
+    async def score_credit_batch(self, requests: List[CreditScoreRequest]) -> List[Dict[str, Any]]:
+        """Calculate credit scores for many users with one model call"""
+        if not self.models_loaded or not self.credit_scorer:
+            raise HTTPException(status_code=503, detail="Credit scorer not available")
+        
+        return await self._run_blocking(self._score_credit_batch_sync, requests)
+    
+    @staticmethod
+    def _credit_feature_mapping(user_features: Dict[str, Any]) -> Dict[str, Any]:
+        """Map API features to model features"""
+        return {
+            'age': user_features.get('age', 30),
+            'income': user_features.get('monthly_income', user_features.get('income', 15000000)),
+            'total_transactions': user_features.get('total_transactions', 50),
+            'avg_transaction_amount': user_features.get('avg_transaction_amount', 300000),
+            'account_age_months': user_features.get('account_age_months', 12),
+            'savings_balance': user_features.get('savings_balance', 10000000),
+            'loan_history': user_features.get('loan_history', 0),
+            'credit_utilization': user_features.get('credit_utilization', 0.5)
+        }
+    
+    def _predict_good_credit(self, X: np.ndarray) -> np.ndarray:
+        """Scale a (B, 28) feature matrix and return P(good credit) per row"""
+        return self.credit_scorer.predict_proba_from_features(X)
+    
+    def _credit_results(self, requests: List[CreditScoreRequest],
+                        mappings: List[Dict[str, Any]], prob_good_credit: np.ndarray) -> List[Dict[str, Any]]:
+        """Apply demo boosts/penalties to model probabilities and build responses"""
+        income = np.array([m['income'] for m in mappings], dtype=np.float64)
+        savings = np.array([m['savings_balance'] for m in mappings], dtype=np.float64)
+        debt = np.array([r.user_features.get('existing_debt', 0) for r in requests], dtype=np.float64)
+        debt_ratio = np.divide(debt, income, out=np.ones_like(income), where=income > 0)
+        
+        # Income boost: 50M+ / 25M+ / 15M+ income raise the probability floor
+        prob = np.maximum(prob_good_credit, np.select(
+            [income >= 50000000, income >= 25000000, income >= 15000000], [0.85, 0.70, 0.50], 0.0
+        ))
+        
+        # Savings boost: 10+ / 5+ months income in savings
+        prob = np.minimum(1.0, prob + np.select(
+            [savings >= income * 10, savings >= income * 5], [0.15, 0.08], 0.0
+        ))
+        
+        # Debt penalty
+        prob = np.select(
+            [debt_ratio > 0.8, debt_ratio > 0.5],
+            [np.maximum(0.1, prob - 0.3), np.maximum(0.2, prob - 0.15)],
+            prob
+        )
+        
+        # Convert to credit score (300-850 range) and grade
+        credit_scores = (300 + prob * 550).astype(int)
+        grade_idx = np.searchsorted(CREDIT_GRADE_CUTOFFS, credit_scores, side='right')
+        
+        results = []
+        for request, mapping, score, idx, p in zip(requests, mappings, credit_scores.tolist(),
+                                                   grade_idx.tolist(), prob.tolist()):
             # Generate reason codes
             reason_codes = []
-            if feature_mapping['income'] < 20000000:
+            if mapping['income'] < 20000000:
                 reason_codes.append("Thu nhập thấp")
-            if feature_mapping['credit_utilization'] > 0.7:
+            if mapping['credit_utilization'] > 0.7:
                 reason_codes.append("Tỷ lệ sử dụng tín dụng cao")
-            if feature_mapping['account_age_months'] < 6:
+            if mapping['account_age_months'] < 6:
                 reason_codes.append("Lịch sử tài khoản ngắn")
             
-            return {
+            results.append({
                 'user_id': request.user_id,
-                'credit_score': credit_score,
-                'score_grade': grade,
-                'default_probability': round(1 - prob_good_credit, 4),
+                'credit_score': score,
+                'score_grade': CREDIT_GRADES[idx],
+                'default_probability': round(1 - p, 4),
                 'reason_codes': reason_codes[:3],  # Top 3 reasons
-                'risk_category': risk,
-                'score_factors': feature_mapping
-            }
+                'risk_category': CREDIT_RISKS[idx],
+                'score_factors': mapping
+            })
+        return results
+    
+    def _score_credit_sync(self, request: CreditScoreRequest) -> Dict[str, Any]:
+        """Credit scoring body, run in the worker thread pool"""
+        # For API, we'll create a simplified prediction method
+        # Create feature vector from user features
+        try:
+            feature_mapping = self._credit_feature_mapping(request.user_features)
+            
+            # Fill the feature vector in the order expected by model; the remaining
+            # default features to match model training stay zero in the scratch row
+            X = self._credit_scratch()
+            X[0, :8] = tuple(feature_mapping.values())
+            
+            prob_good_credit = self._predict_good_credit(X)
+            return self._credit_results([request], [feature_mapping], prob_good_credit)[0]
             
         except Exception as e:
-            # Fallback to simple scoring
-            income_score = min(request.user_features.get('income', 15000000) / 50000000, 1.0)
-            age_score = min(request.user_features.get('age', 25) / 50, 1.0)
-            base_score = int(300 + (income_score + age_score) / 2 * 550)
+            return self._fallback_credit_score(request)
+    
+    def _score_credit_batch_sync(self, requests: List[CreditScoreRequest]) -> List[Dict[str, Any]]:
+        """Batch credit scoring body: one (B, 28) matrix, one predict_proba call"""
+        if not requests:
+            return []
+        try:
+            mappings = [self._credit_feature_mapping(r.user_features) for r in requests]
+            X = np.zeros((len(requests), CREDIT_FEATURE_COUNT), dtype=np.float64)
+            X[:, :8] = [tuple(m.values()) for m in mappings]
             
-            return {
-                'user_id': request.user_id,
-                'credit_score': base_score,
-                'score_grade': 'B',
-                'default_probability': 0.15,
-                'reason_codes': ['Đánh giá sơ bộ'],
-                'risk_category': 'Medium',
-                'score_factors': request.user_features
-            }
+            return self._credit_results(requests, mappings, self._predict_good_credit(X))
+            
+        except Exception:
+            # A bad row fails the whole matrix; score individually so only it falls back
+            return [self._score_credit_sync(r) for r in requests]
+    
+    @staticmethod
+    def _fallback_credit_score(request: CreditScoreRequest) -> Dict[str, Any]:
+        """Fallback to simple scoring"""
+        income_score = min(request.user_features.get('income', 15000000) / 50000000, 1.0)
+        age_score = min(request.user_features.get('age', 25) / 50, 1.0)
+        base_score = int(300 + (income_score + age_score) / 2 * 550)
+        
+        return {
+            'user_id': request.user_id,
+            'credit_score': base_score,
+            'score_grade': 'B',
+            'default_probability': 0.15,
+            'reason_codes': ['Đánh giá sơ bộ'],
+            'risk_category': 'Medium',
+            'score_factors': request.user_features
+        }
     
     async def detect_anomaly(self, transaction: TransactionRequest, 
                            recent_transactions: Optional[List[Dict]] = None) -> Dict[str, Any]:
@@ -290,34 +442,66 @@ class MLService:
             'user_id': transaction.user_id,
             'amount': float(transaction.amount),
             'location': transaction.location,
-            'transaction_date': transaction.transaction_date or datetime.now().isoformat()
+            'transaction_date': transaction.transaction_date or utc_timestamp()
         }
         
-        # Add category from spend classification
-        if self.spend_classifier:
+        # Add category, classifying only when the caller did not supply one
+        if transaction.category:
+            txn_data['category'] = transaction.category
+        elif self.spend_classifier:
             spend_result = await self.classify_spend(transaction)
             txn_data['category'] = spend_result['category']
         
+        # The server-side window stores dates as naive UTC: aware dates are converted, naive
+        # dates are assumed to already be UTC, and dateless requests default to UTC now
+        window_date = self._window_timestamp(txn_data['transaction_date'])
+        detect_data = txn_data
+        
+        # Fall back to the server-side window when the client sends no history
+        if not recent_transactions and window_date is not None:
+            recent_transactions = list(self._recent_txns.get(transaction.user_id, ()))
+            if recent_transactions:
+                detect_data = {**txn_data, 'transaction_date': window_date}
+        
         # Detect anomaly
-        result = self.anomaly_detector.detect_transaction_anomaly(
-            txn_data, recent_transactions or []
+        result = await self._run_blocking(
+            self._detect_anomaly_sync, detect_data, recent_transactions
         )
+        if window_date is not None:
+            self._remember_transaction({**txn_data, 'transaction_date': window_date})
+        return result
+    
+    @staticmethod
+    def _window_timestamp(value: Any) -> Optional[str]:
+        """ISO string in naive UTC for the rolling window (naive input is taken as UTC); None when the date does not parse"""
+        try:
+            ts = pd.Timestamp(value)
+        except (TypeError, ValueError):
+            return None
+        if pd.isna(ts):
+            return None
+        if ts.tzinfo is not None:
+            ts = ts.tz_convert("UTC").tz_localize(None)
+        return ts.isoformat()
+    
+    def _remember_transaction(self, txn_data: Dict[str, Any]):
+        """Append a transaction (date already normalised) to its user's rolling window"""
+        user_id = txn_data['user_id']
+        window = self._recent_txns.get(user_id)
+        if window is None:
+            window = self._recent_txns[user_id] = deque(maxlen=RECENT_TXN_WINDOW)
+            if len(self._recent_txns) > RECENT_TXN_MAX_USERS:
+                self._recent_txns.popitem(last=False)
+        else:
+            self._recent_txns.move_to_end(user_id)
+        window.append(txn_data)
+    
+    def _detect_anomaly_sync(self, txn_data: Dict[str, Any], recent_transactions: List[Dict]) -> Dict[str, Any]:
+        """Anomaly detection body, run in the worker thread pool"""
+        with self._anomaly_lock:
+            result = self.anomaly_detector.detect_transaction_anomaly(txn_data, recent_transactions)
         
         # Convert numpy types to Python native types
-        def convert_numpy_types(obj):
-            if hasattr(obj, 'dtype'):
-                if obj.dtype.kind in ['i', 'u']:  # integer types
-                    return int(obj)
-                elif obj.dtype.kind == 'f':  # float types
-                    return float(obj)
-                elif obj.dtype.kind == 'b':  # boolean types
-                    return bool(obj)
-            elif isinstance(obj, dict):
-                return {k: convert_numpy_types(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_numpy_types(v) for v in obj]
-            return obj
-        
         return convert_numpy_types(result)
     
     async def generate_insights(self, request: InsightsRequest) -> Dict[str, Any]:
@@ -325,9 +509,17 @@ class MLService:
         if not self.insights_engine:
             raise HTTPException(status_code=503, detail="Insights engine not available")
         
-        # Convert transactions to DataFrame
-        import pandas as pd
-        transactions_df = pd.DataFrame(request.transactions)
+        return await self._run_blocking(self._generate_insights_sync, request)
+    
+    def _generate_insights_sync(self, request: InsightsRequest) -> Dict[str, Any]:
+        """Insights body, run in the worker thread pool"""
+        # Convert transactions to DataFrame, keeping only the columns the engine reads;
+        # an empty list still gets the full typed-column layout instead of a column-less frame
+        present = set().union(*map(dict.keys, request.transactions))
+        columns = list(InsightsEngine.INPUT_COLUMNS)
+        if request.transactions:
+            columns = [c for c in columns if c in present]
+        transactions_df = pd.DataFrame.from_records(request.transactions, columns=columns)
         
         # Generate insights
         insights = self.insights_engine.generate_insights(
@@ -336,20 +528,6 @@ class MLService:
         )
         
         # Convert numpy types to Python native types for JSON serialization
-        def convert_numpy_types(obj):
-            if isinstance(obj, np.integer):
-                return int(obj)
-            elif isinstance(obj, np.floating):
-                return float(obj)
-            elif isinstance(obj, np.ndarray):
-                return obj.tolist()
-            elif isinstance(obj, dict):
-                return {k: convert_numpy_types(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [convert_numpy_types(v) for v in obj]
-            else:
-                return obj
-        
         insights = convert_numpy_types(insights)
         
         return {
@@ -366,13 +544,20 @@ ml_service = MLService()
 app = FastAPI(
     title="Unity Wallet ML API",
     description="AI Tài chính: Phân tích chi tiêu, Chấm điểm tín dụng, Cảnh báo gian lận",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 @app.on_event("startup")
 async def startup_event():
     """Load models on startup"""
     await ml_service.load_models()
+    ml_service.start_batching()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers"""
+    ml_service.shutdown()
 
 @app.get("/health")
 async def health_check():
@@ -380,18 +565,18 @@ async def health_check():
     return {
         "status": "healthy",
         "models_loaded": ml_service.models_loaded,
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": iso_timestamp(),
         "performance": ml_service.get_performance_stats()
     }
 
 @app.post("/analytics/spend", response_model=AnalyticsResponse)
 async def analyze_spend(transaction: TransactionRequest):
     """Phân loại danh mục chi tiêu"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         result = await ml_service.classify_spend(transaction)
-        processing_time = (time.time() - start_time) * 1000
+        processing_time = (time.perf_counter() - start_time) * 1000
         
         ml_service.track_performance(processing_time)
         
@@ -400,7 +585,7 @@ async def analyze_spend(transaction: TransactionRequest):
             data=result,
             processing_time_ms=processing_time,
             model_version="spend_classifier_v1.0",
-            timestamp=datetime.now().isoformat()
+            timestamp=iso_timestamp()
         )
         
     except Exception as e:
@@ -410,11 +595,11 @@ async def analyze_spend(transaction: TransactionRequest):
 @app.post("/analytics/credit", response_model=AnalyticsResponse)
 async def analyze_credit(request: CreditScoreRequest):
     """Chấm điểm tín dụng"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         result = await ml_service.score_credit(request)
-        processing_time = (time.time() - start_time) * 1000
+        processing_time = (time.perf_counter() - start_time) * 1000
         
         ml_service.track_performance(processing_time)
         
@@ -423,21 +608,44 @@ async def analyze_credit(request: CreditScoreRequest):
             data=result,
             processing_time_ms=processing_time,
             model_version="credit_scorer_v1.0",
-            timestamp=datetime.now().isoformat()
+            timestamp=iso_timestamp()
         )
         
     except Exception as e:
         logger.error(f"Credit scoring error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analytics/credit/batch", response_model=AnalyticsResponse)
+async def analyze_credit_batch(requests: List[CreditScoreRequest]):
+    """Chấm điểm tín dụng theo lô"""
+    start_time = time.perf_counter()
+    
+    try:
+        results = await ml_service.score_credit_batch(requests)
+        processing_time = (time.perf_counter() - start_time) * 1000
+        
+        ml_service.track_performance(processing_time)
+        
+        return AnalyticsResponse(
+            status="success",
+            data={"results": results, "count": len(results)},
+            processing_time_ms=processing_time,
+            model_version="credit_scorer_v1.0",
+            timestamp=iso_timestamp()
+        )
+        
+    except Exception as e:
+        logger.error(f"Batch credit scoring error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/analytics/alerts", response_model=AnalyticsResponse)
 async def analyze_alerts(request: AnomalyRequest):
     """Cảnh báo gian lận"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         result = await ml_service.detect_anomaly(request.transaction, request.recent_transactions)
-        processing_time = (time.time() - start_time) * 1000
+        processing_time = (time.perf_counter() - start_time) * 1000
         
         ml_service.track_performance(processing_time)
         
@@ -446,7 +654,7 @@ async def analyze_alerts(request: AnomalyRequest):
             data=result,
             processing_time_ms=processing_time,
             model_version="anomaly_detector_v1.0",
-            timestamp=datetime.now().isoformat()
+            timestamp=iso_timestamp()
         )
         
     except Exception as e:
@@ -456,11 +664,11 @@ async def analyze_alerts(request: AnomalyRequest):
 @app.post("/analytics/insights", response_model=AnalyticsResponse)
 async def analyze_insights(request: InsightsRequest):
     """Tạo insights tài chính"""
-    start_time = time.time()
+    start_time = time.perf_counter()
     
     try:
         result = await ml_service.generate_insights(request)
-        processing_time = (time.time() - start_time) * 1000
+        processing_time = (time.perf_counter() - start_time) * 1000
         
         ml_service.track_performance(processing_time)
         
@@ -469,7 +677,7 @@ async def analyze_insights(request: InsightsRequest):
             data=result,
             processing_time_ms=processing_time,
             model_version="insights_engine_v1.0",
-            timestamp=datetime.now().isoformat()
+            timestamp=iso_timestamp()
         )
         
     except Exception as e:
@@ -488,7 +696,7 @@ async def get_metrics():
             "anomaly_detector": ml_service.anomaly_detector is not None,
             "insights_engine": ml_service.insights_engine is not None
         },
-        "timestamp": datetime.now().isoformat()
+        "timestamp": iso_timestamp()
     }
 
 @app.get("/")
@@ -511,10 +719,20 @@ async def root():
 
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "service:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
+    if os.getenv("ENV") == "dev":
+        # Reloader is a dev convenience only; it forces a single worker
+        uvicorn.run("service:app", host="0.0.0.0", port=8000, reload=True, log_level="info")
+    else:
+        # Single worker by default: performance stats, the anomaly detector's alert
+        # cooldowns (alert_history) and the recent-transaction velocity window all live
+        # in process memory, so with WORKERS > 1 each worker keeps its own copy and
+        # cooldown/velocity results depend on which worker serves the request
+        uvicorn.run(
+            "service:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=int(os.getenv("WORKERS", "1")),
+            loop="uvloop",
+            http="httptools",
+            log_level="info"
+        )
@@ -2,6 +2,7 @@
 Configuration settings for the ML module
 """
 import os
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, List
 
@@ -80,6 +81,41 @@ MCC_CATEGORY_MAPPING = {
     "default": "Others"
 }
 
+# MCC ranges parsed once at import into sorted bounds for O(log K) lookup
+_MCC_RANGES = sorted(
+    (int(lo), int(hi), category)
+    for key, category in MCC_CATEGORY_MAPPING.items() if "-" in key
+    for lo, hi in [key.split("-")]
+)
+
+@lru_cache(maxsize=1)
+def _mcc_lookup_arrays():
+    """Sorted numpy bounds for classify_mcc; numpy is imported on first use so config stays stdlib-only"""
+    import numpy as np
+    return (
+        np.array([r[0] for r in _MCC_RANGES], dtype=np.int64),
+        np.array([r[1] for r in _MCC_RANGES], dtype=np.int64),
+        np.array([r[2] for r in _MCC_RANGES], dtype=object),
+    )
+
+def classify_mcc(codes):
+    """Map MCC codes (ints, floats or digit strings; scalar or array) to categories in one searchsorted pass"""
+    import numpy as np
+    import pandas as pd
+    mcc_lo, mcc_hi, mcc_cat = _mcc_lookup_arrays()
+    
+    # Missing or non-numeric codes (NaN, "", None, "abc") fall through to the default category;
+    # a pandas mcc column with gaps arrives as float, so whole-number floats are valid codes
+    values = pd.to_numeric(np.atleast_1d(codes), errors="coerce").astype(np.float64)
+    valid = np.isfinite(values) & (values == np.floor(values))
+    values = np.where(valid, values, -1).astype(np.int64)
+    
+    idx = np.searchsorted(mcc_lo, values, side="right") - 1
+    safe_idx = np.clip(idx, 0, None)
+    hit = valid & (idx >= 0) & (values <= mcc_hi[safe_idx])
+    categories = np.where(hit, mcc_cat[safe_idx], MCC_CATEGORY_MAPPING["default"])
+    return categories[0] if np.ndim(codes) == 0 else categories
+
 # API settings
 API_CONFIG = {
     "max_response_time_ms": 300,
@@ -10,10 +10,12 @@ import pandas as pd
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Set, Tuple, Optional
-from geopy.distance import geodesic
-import warnings
-warnings.filterwarnings('ignore')
 
+# Mean Earth radius (km) for the haversine great-circle distance
+EARTH_RADIUS_KM = 6371.0088
+
+# Frequency stats for a user with no dated transactions
+NO_DAILY_STATS = {'mean': np.nan, 'max': np.nan, 'std': np.nan}
 
 class AnomalyDetector:
     """Rule-based anomaly detector with geographical analysis"""
@@ -76,75 +78,163 @@ class AnomalyDetector:
             'Vinh Long': (10.2397, 105.9572),
             'Sa Dec': (10.2958, 105.7567)
         }
+        self._index_cities()
+    
+    def _index_cities(self):
+        """Lay city coordinates out as parallel radian arrays for vectorized distances"""
+        self._city_index = {city: i for i, city in enumerate(self.city_locations)}
+        coords = np.radians(np.array(list(self.city_locations.values()), dtype=np.float64).reshape(-1, 2))
+        self._city_lat = coords[:, 0]
+        self._city_lon = coords[:, 1]
+        
+        # Common-city bitmask -> city index array, filled on demand
+        self._mask_city_idx: Dict[int, np.ndarray] = {}
+    
+    def _city_mask(self, locations: Set[str]) -> int:
+        """Bitmask of the known cities among locations, one bit per city index"""
+        mask = 0
+        for loc in locations:
+            idx = self._city_index.get(loc)
+            if idx is not None:
+                mask |= 1 << idx
+        return mask
+    
+    def _common_city_mask(self, baseline: Dict) -> int:
+        """Baseline's common-city bitmask, derived once for baselines loaded without one"""
+        mask = baseline.get('common_city_mask')
+        if mask is None:
+            mask = baseline['common_city_mask'] = self._city_mask(baseline['common_locations'])
+        return mask
+    
+    def _mask_city_indices(self, mask: int) -> np.ndarray:
+        """City indices set in a common-city bitmask (cached per distinct mask)"""
+        idx = self._mask_city_idx.get(mask)
+        if idx is None:
+            idx = self._mask_city_idx[mask] = np.array(
+                [i for i in range(mask.bit_length()) if mask >> i & 1], dtype=np.intp
+            )
+        return idx
+    
+    def _min_common_distance_km(self, city_idx: int, common_mask: int) -> float:
+        """Distance from a city to the nearest common city (inf when there is none)"""
+        # Distance to every known common location in one vectorized haversine pass
+        common_idx = self._mask_city_indices(common_mask)
+        if not len(common_idx):
+            return float('inf')
+        return float(self._city_distances_km(city_idx, common_idx).min())
+    
+    def _city_distances_km(self, city_idx: int, other_idx: np.ndarray) -> np.ndarray:
+        """Haversine distances from one city to several cities, in km"""
+        lat1, lon1 = self._city_lat[city_idx], self._city_lon[city_idx]
+        lat2, lon2 = self._city_lat[other_idx], self._city_lon[other_idx]
+        a = (np.sin((lat2 - lat1) / 2) ** 2
+             + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
     
     def build_user_baseline(self, user_id: str, transactions_df: pd.DataFrame) -> Dict:
         """Build baseline behavior patterns for a user"""
-        user_txns = transactions_df[transactions_df['user_id'] == user_id].copy()
-        
-        if len(user_txns) < self.config['min_transactions_for_baseline']:
-            return None
-        
-        # Amount statistics
-        amounts = user_txns['amount'].astype(float)
-        amount_stats = {
-            'mean': amounts.mean(),
-            'median': amounts.median(),
-            'std': amounts.std(),
-            'q25': amounts.quantile(0.25),
-            'q75': amounts.quantile(0.75),
-            'iqr_lower': amounts.quantile(0.25) - 1.5 * (amounts.quantile(0.75) - amounts.quantile(0.25)),
-            'iqr_upper': amounts.quantile(0.75) + 1.5 * (amounts.quantile(0.75) - amounts.quantile(0.25))
-        }
-        
-        # Frequency patterns
-        user_txns['date'] = pd.to_datetime(user_txns['transaction_date']).dt.date
-        daily_counts = user_txns.groupby('date').size()
-        
-        frequency_stats = {
-            'avg_daily_transactions': daily_counts.mean(),
-            'max_daily_transactions': daily_counts.max(),
-            'std_daily_transactions': daily_counts.std()
-        }
-        
-        # Location patterns
-        location_counts = user_txns['location'].value_counts()
-        common_locations = set(location_counts.head(5).index)
-        
-        # Category patterns
-        category_amounts = user_txns.groupby('category')['amount'].agg(['mean', 'std', 'count']).to_dict('index')
-        
-        # Time patterns
-        user_txns['hour'] = pd.to_datetime(user_txns['transaction_date']).dt.hour
-        user_txns['day_of_week'] = pd.to_datetime(user_txns['transaction_date']).dt.dayofweek
-        
-        hour_counts = user_txns['hour'].value_counts().to_dict()
-        dow_counts = user_txns['day_of_week'].value_counts().to_dict()
-        
-        return {
-            'user_id': user_id,
-            'transaction_count': len(user_txns),
-            'amount_stats': amount_stats,
-            'frequency_stats': frequency_stats,
-            'common_locations': common_locations,
-            'category_patterns': category_amounts,
-            'hour_patterns': hour_counts,
-            'day_patterns': dow_counts,
-            'created_at': datetime.now().isoformat()
-        }
+        user_txns = transactions_df[transactions_df['user_id'] == user_id]
+        return self._build_baselines(user_txns).get(user_id)
     
     def build_all_baselines(self, transactions_df: pd.DataFrame):
         """Build baselines for all users"""
-        user_ids = transactions_df['user_id'].unique()
+        print(f"🔍 Building baselines for {transactions_df['user_id'].nunique()} users...")
         
-        print(f"🔍 Building baselines for {len(user_ids)} users...")
-        
-        for user_id in user_ids:
-            baseline = self.build_user_baseline(user_id, transactions_df)
-            if baseline:
-                self.user_baselines[user_id] = baseline
+        self.user_baselines.update(self._build_baselines(transactions_df))
         
         print(f"✅ Built baselines for {len(self.user_baselines)} users")
     
+    def _build_baselines(self, transactions_df: pd.DataFrame) -> Dict[str, Dict]:
+        """Build baselines for every user in the frame with one date parse and one groupby pass"""
+        if len(transactions_df) == 0:
+            return {}
+        
+        # Parse dates and derive time columns once for the whole frame
+        dates = pd.to_datetime(transactions_df['transaction_date'])
+        df = pd.DataFrame({
+            'user_id': transactions_df['user_id'],
+            'amount': transactions_df['amount'].astype(float),
+            'location': transactions_df['location'],
+            'category': transactions_df['category'],
+            'date': dates.dt.normalize(),
+            'hour': dates.dt.hour,
+            'day_of_week': dates.dt.dayofweek,
+        }, index=transactions_df.index)
+        
+        grouped = df.groupby('user_id', sort=False)
+        
+        # Amount statistics for all users at once
+        amount_stats = grouped['amount'].agg(['mean', 'median', 'std'])
+        quartiles = grouped['amount'].quantile([0.25, 0.75]).unstack()
+        amount_stats['q25'] = quartiles[0.25]
+        amount_stats['q75'] = quartiles[0.75]
+        amount_stats = amount_stats.to_dict('index')
+        
+        # Frequency patterns: per-user daily counts, then their mean/max/std
+        daily_stats = (
+            df.groupby(['user_id', 'date'], sort=False).size()
+            .groupby(level='user_id', sort=False).agg(['mean', 'max', 'std'])
+            .to_dict('index')
+        )
+        
+        # Hour / day-of-week histograms for every user from one bincount over (user, bucket) codes;
+        # stored as fixed-size count arrays indexed by hour (24) and weekday (7)
+        user_codes, user_index = pd.factorize(df['user_id'])
+        user_rows = {user_id: row for row, user_id in enumerate(user_index)}
+        # Rows without a user or a parseable date are left out, as value_counts dropped NaN
+        known = (user_codes >= 0) & df['hour'].notna().to_numpy()
+        user_codes = user_codes[known]
+        hours = df['hour'].to_numpy()[known].astype(np.int64)
+        weekdays = df['day_of_week'].to_numpy()[known].astype(np.int64)
+        hour_counts = np.bincount(user_codes * 24 + hours, minlength=len(user_index) * 24).reshape(-1, 24)
+        dow_counts = np.bincount(user_codes * 7 + weekdays, minlength=len(user_index) * 7).reshape(-1, 7)
+        
+        created_at = datetime.now().isoformat()
+        baselines = {}
+        
+        for user_id, user_txns in grouped:
+            if len(user_txns) < self.config['min_transactions_for_baseline']:
+                continue
+            
+            stats = amount_stats[user_id]
+            iqr = stats['q75'] - stats['q25']
+            # Users whose dates are all missing have no daily counts: NaN stats, as before
+            daily = daily_stats.get(user_id, NO_DAILY_STATS)
+            
+            # Location patterns
+            location_counts = user_txns['location'].value_counts()
+            common_locations = set(location_counts.head(5).index)
+            
+            # Category patterns
+            category_amounts = user_txns.groupby('category')['amount'].agg(['mean', 'std', 'count']).to_dict('index')
+            
+            baselines[user_id] = {
+                'user_id': user_id,
+                'transaction_count': len(user_txns),
+                'amount_stats': {
+                    'mean': stats['mean'],
+                    'median': stats['median'],
+                    'std': stats['std'],
+                    'q25': stats['q25'],
+                    'q75': stats['q75'],
+                    'iqr_lower': stats['q25'] - 1.5 * iqr,
+                    'iqr_upper': stats['q75'] + 1.5 * iqr
+                },
+                'frequency_stats': {
+                    'avg_daily_transactions': daily['mean'],
+                    'max_daily_transactions': daily['max'],
+                    'std_daily_transactions': daily['std']
+                },
+                'common_locations': common_locations,
+                'common_city_mask': self._city_mask(common_locations),
+                'category_patterns': category_amounts,
+                'hour_patterns': hour_counts[user_rows[user_id]],
+                'day_patterns': dow_counts[user_rows[user_id]],
+                'created_at': created_at
+            }
+        
+        return baselines
+    
     def detect_amount_anomaly(self, user_id: str, amount: float) -> Dict:
         """Detect unusual transaction amounts"""
         if user_id not in self.user_baselines:
@@ -218,12 +308,18 @@ class AnomalyDetector:
         
         # Count transactions in the velocity window
         window_start = current_time - timedelta(hours=self.config['velocity_window_hours'])
-        window_transactions = [
-            txn for txn in recent_transactions 
-            if pd.to_datetime(txn['transaction_date']) >= window_start
-        ]
-        
-        window_count = len(window_transactions)
+        dates = [txn['transaction_date'] for txn in recent_transactions]
+        try:
+            # One vectorized ISO8601 parse for the whole window instead of one call per transaction
+            times = pd.DatetimeIndex(pd.to_datetime(dates, format='ISO8601'))
+            if times.is_monotonic_increasing:
+                # Chronological windows (the usual case): binary search for the window start
+                window_count = len(times) - int(times.searchsorted(window_start, side='left'))
+            else:
+                window_count = int((times >= window_start).sum())
+        except (ValueError, TypeError):
+            # Mixed formats/timezones: fall back to parsing one by one
+            window_count = sum(1 for date in dates if pd.to_datetime(date) >= window_start)
         expected_count = freq_stats['avg_daily_transactions'] * (self.config['velocity_window_hours'] / 24)
         
         # Anomaly if significantly more transactions than expected
@@ -258,13 +354,13 @@ class AnomalyDetector:
         
         baseline = self.user_baselines[user_id]
         common_locations = baseline['common_locations']
+        city_idx = self._city_index.get(location)
         
-        # Check if location is in common locations
-        if location in common_locations:
-            return {'is_anomaly': False, 'reason': 'common_location', 'severity': 0.0}
-        
-        # Check geographical distance from common locations
-        if location not in self.city_locations:
+        if city_idx is None:
+            # Check if location is in common locations
+            if location in common_locations:
+                return {'is_anomaly': False, 'reason': 'common_location', 'severity': 0.0}
+            
             # Unknown location - treat as moderate anomaly
             return {
                 'is_anomaly': True,
@@ -273,14 +369,11 @@ class AnomalyDetector:
                 'details': {'location': location}
             }
         
-        current_coords = self.city_locations[location]
-        min_distance = float('inf')
-        
-        for common_loc in common_locations:
-            if common_loc in self.city_locations:
-                common_coords = self.city_locations[common_loc]
-                distance = geodesic(current_coords, common_coords).kilometers
-                min_distance = min(min_distance, distance)
+        # Known city: membership and the common city indices both come from the bitmask
+        common_mask = self._common_city_mask(baseline)
+        if common_mask >> city_idx & 1:
+            return {'is_anomaly': False, 'reason': 'common_location', 'severity': 0.0}
+        min_distance = self._min_common_distance_km(city_idx, common_mask)
         
         # Anomaly if too far from common locations
         is_anomaly = min_distance > self.config['geo_radius_km']
@@ -357,7 +450,11 @@ class AnomalyDetector:
         if alert_type not in user_alerts:
             return False
         
-        last_alert_time = pd.to_datetime(user_alerts[alert_type])
+        # record_alert stores datetime.isoformat(), which the stdlib parser reads directly
+        try:
+            last_alert_time = datetime.fromisoformat(user_alerts[alert_type])
+        except (TypeError, ValueError):
+            last_alert_time = pd.to_datetime(user_alerts[alert_type])
         cooldown_end = last_alert_time + timedelta(hours=self.config['cooldown_hours'])
         
         return datetime.now() < cooldown_end
@@ -376,40 +473,127 @@ class AnomalyDetector:
         amount = float(transaction['amount'])
         location = transaction.get('location', 'Unknown')
         category = transaction.get('category', 'Others')
-        transaction_time = pd.to_datetime(transaction['transaction_date'])
         
-        anomalies = []
-        max_severity = 0.0
-        overall_anomaly = False
+        baseline = self.user_baselines.get(user_id)
+        
+        # Cheap numeric flags first; the detailed result dicts are only built for checks
+        # that fire, so a normal transaction allocates none of them
+        checks = []
         
         # 1. Amount anomaly
-        amount_result = self.detect_amount_anomaly(user_id, amount)
-        if amount_result['is_anomaly']:
-            anomalies.append(amount_result)
-            max_severity = max(max_severity, amount_result['severity'])
-            overall_anomaly = True
+        if baseline is not None and self._amount_flag(baseline, amount):
+            checks.append(self.detect_amount_anomaly(user_id, amount))
         
         # 2. Velocity anomaly
         if recent_transactions:
-            velocity_result = self.detect_velocity_anomaly(user_id, transaction_time, recent_transactions)
-            if velocity_result['is_anomaly']:
-                anomalies.append(velocity_result)
-                max_severity = max(max_severity, velocity_result['severity'])
-                overall_anomaly = True
-        
-        # 3. Location anomaly
-        location_result = self.detect_location_anomaly(user_id, location)
-        if location_result['is_anomaly']:
-            anomalies.append(location_result)
-            max_severity = max(max_severity, location_result['severity'])
-            overall_anomaly = True
-        
-        # 4. Category anomaly
-        category_result = self.detect_category_anomaly(user_id, category, amount)
-        if category_result['is_anomaly']:
-            anomalies.append(category_result)
-            max_severity = max(max_severity, category_result['severity'])
-            overall_anomaly = True
+            # Only the velocity check needs the transaction time, so parse it only here
+            transaction_time = pd.to_datetime(transaction['transaction_date'])
+            checks.append(self.detect_velocity_anomaly(user_id, transaction_time, recent_transactions))
+        
+        # 3. Location anomaly / 4. Category anomaly
+        if baseline is not None:
+            if self._location_flag(baseline, location):
+                checks.append(self.detect_location_anomaly(user_id, location))
+            if self._category_flag(baseline, category, amount):
+                checks.append(self.detect_category_anomaly(user_id, category, amount))
+        
+        anomalies = [check for check in checks if check['is_anomaly']]
+        max_severity = max((check['severity'] for check in anomalies), default=0.0)
+        
+        return self._finalize_detection(transaction, anomalies, max_severity, bool(anomalies))
+    
+    def detect_transactions_anomaly_batch(self, transactions_df: pd.DataFrame) -> List[Dict]:
+        """Detect anomalies for a frame of independent transactions (no velocity check).
+        
+        The amount check runs as one vectorized screen against per-user baseline arrays and
+        the other checks use the numeric flags; result dicts are only built for checks that fire. Alerts and
+        cooldowns are applied in row order, as repeated detect_transaction_anomaly calls would.
+        """
+        if len(transactions_df) == 0:
+            return []
+        
+        user_ids = transactions_df['user_id'].tolist()
+        amounts = transactions_df['amount'].to_numpy(dtype=np.float64)
+        amount_flags = self._amount_anomaly_mask(transactions_df['user_id'], amounts)
+        
+        def column(name: str, default: str) -> List:
+            return transactions_df[name].tolist() if name in transactions_df.columns else [default] * len(transactions_df)
+        
+        results = []
+        for transaction, user_id, amount, amount_flag, location, category in zip(
+            transactions_df.to_dict('records'), user_ids, amounts.tolist(), amount_flags,
+            column('location', 'Unknown'), column('category', 'Others')
+        ):
+            baseline = self.user_baselines.get(user_id)
+            checks = []
+            if amount_flag:
+                checks.append(self.detect_amount_anomaly(user_id, amount))
+            if baseline is not None:
+                if self._location_flag(baseline, location):
+                    checks.append(self.detect_location_anomaly(user_id, location))
+                if self._category_flag(baseline, category, amount):
+                    checks.append(self.detect_category_anomaly(user_id, category, amount))
+            anomalies = [check for check in checks if check['is_anomaly']]
+            max_severity = max((check['severity'] for check in anomalies), default=0.0)
+            results.append(self._finalize_detection(transaction, anomalies, max_severity, bool(anomalies)))
+        
+        return results
+    
+    def _amount_anomaly_mask(self, user_ids: pd.Series, amounts: np.ndarray) -> np.ndarray:
+        """Vectorized is_anomaly of detect_amount_anomaly for many rows (False without a baseline)"""
+        if not self.user_baselines:
+            return np.zeros(len(amounts), dtype=bool)
+        
+        stats = pd.DataFrame.from_dict(
+            {user_id: baseline['amount_stats'] for user_id, baseline in self.user_baselines.items()},
+            orient='index'
+        ).reindex(user_ids.to_numpy())
+        mean = stats['mean'].to_numpy(dtype=np.float64)
+        std = stats['std'].to_numpy(dtype=np.float64)
+        
+        # NaN rows (no baseline) compare False everywhere
+        with np.errstate(divide='ignore', invalid='ignore'):
+            is_statistical = (std > 0) & (np.abs(amounts - mean) / std > 2.5)
+        is_iqr = ((amounts < stats['iqr_lower'].to_numpy(dtype=np.float64)) |
+                  (amounts > stats['iqr_upper'].to_numpy(dtype=np.float64)))
+        is_multiplier = amounts > mean * self.config['amount_threshold_multiplier']
+        
+        return is_statistical | is_iqr | is_multiplier
+    
+    def _amount_flag(self, baseline: Dict, amount: float) -> bool:
+        """is_anomaly of detect_amount_anomaly, without building its result"""
+        stats = baseline['amount_stats']
+        mean_amount, std_amount = stats['mean'], stats['std']
+        if std_amount > 0 and abs(amount - mean_amount) / std_amount > 2.5:
+            return True
+        return (amount < stats['iqr_lower'] or amount > stats['iqr_upper'] or
+                amount > mean_amount * self.config['amount_threshold_multiplier'])
+    
+    def _location_flag(self, baseline: Dict, location: str) -> bool:
+        """is_anomaly of detect_location_anomaly, without building its result"""
+        city_idx = self._city_index.get(location)
+        if city_idx is None:
+            return location not in baseline['common_locations']
+        common_mask = self._common_city_mask(baseline)
+        if common_mask >> city_idx & 1:
+            return False
+        return self._min_common_distance_km(city_idx, common_mask) > self.config['geo_radius_km']
+    
+    def _category_flag(self, baseline: Dict, category: str, amount: float) -> bool:
+        """is_anomaly of detect_category_anomaly, without building its result"""
+        cat_stats = baseline['category_patterns'].get(category)
+        if cat_stats is None:
+            return True
+        mean_amount = cat_stats['mean']
+        std_amount = cat_stats.get('std', 0)
+        if std_amount > 0:
+            return abs(amount - mean_amount) / std_amount > 2.0
+        return abs(amount - mean_amount) > mean_amount * 0.5
+    
+    def _finalize_detection(self, transaction: Dict, anomalies: List[Dict],
+                            max_severity: float, overall_anomaly: bool) -> Dict:
+        """Alert level, cooldown bookkeeping and message for one transaction's anomalies"""
+        user_id = transaction['user_id']
         
         # Determine alert level
         alert_level = 'none'
@@ -504,6 +688,7 @@ class AnomalyDetector:
         self.user_baselines = detector_data['user_baselines']
         self.alert_history = detector_data.get('alert_history', {})
         self.city_locations = detector_data.get('city_locations', self.city_locations)
+        self._index_cities()
         
         print(f"✅ Anomaly detector loaded from {model_path}")
 
@@ -596,12 +781,4 @@ def train_anomaly_detector():
 
 
 if __name__ == "__main__":
-    # Install geopy if not available
-    try:
-        from geopy.distance import geodesic
-    except ImportError:
-        import subprocess
-        subprocess.check_call(["pip", "install", "geopy"])
-        from geopy.distance import geodesic
-    
     train_anomaly_detector()
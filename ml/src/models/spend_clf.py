@@ -16,8 +16,20 @@ from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, confusion_matrix, f1_score
 from sklearn.pipeline import Pipeline
-import warnings
-warnings.filterwarnings('ignore')
+
+# Keyword-based fallback rules, checked in order (substring match on cleaned text);
+# built once at import instead of on every apply_rules call
+KEYWORD_RULES = (
+    ('Travel', ('vietjet', 'vietnam airlines', 'bamboo airways', 'flight', 'airline', 'airport', 'ticket')),
+    ('Accommodation', ('hotel', 'resort', 'motel', 'homestay', 'airbnb', 'booking', 'lodge')),
+    ('F&B', ('restaurant', 'cafe', 'coffee', 'food', 'eat', 'drink', 'pizza', 'burger', 'pho', 'com')),
+    ('Transportation', ('taxi', 'grab', 'uber', 'bus', 'train', 'fuel', 'gas', 'petrol', 'parking')),
+    ('Shopping', ('shop', 'store', 'mall', 'market', 'buy', 'purchase', 'retail', 'clothing')),
+    ('Entertainment', ('movie', 'cinema', 'game', 'sport', 'gym', 'music', 'concert', 'club')),
+    ('Healthcare', ('hospital', 'clinic', 'doctor', 'pharmacy', 'medical', 'health', 'drug')),
+    ('Education', ('school', 'university', 'course', 'book', 'tuition', 'education', 'learn')),
+    ('Banking', ('bank', 'atm', 'transfer', 'loan', 'insurance', 'credit', 'finance')),
+)
 
 class SpendClassifier:
     """
@@ -62,12 +74,18 @@ class SpendClassifier:
         
         return text
     
-    def apply_rules(self, description: str, mcc: str, merchant_name: str) -> Optional[str]:
-        """Apply rule-based classification first"""
+    def apply_rules(self, description: str, mcc: str, merchant_name: str,
+                    mcc_range_category: Optional[str] = None) -> Optional[str]:
+        """Apply rule-based classification first (mcc_range_category: precomputed classify_mcc result)"""
         
-        # MCC-based rules
+        # MCC-based rules: exact codes from the JSON mapping, then the config MCC ranges
         if str(mcc) in self.mcc_mapping:
             return self.mcc_mapping[str(mcc)]['category']
+        from config import classify_mcc, MCC_CATEGORY_MAPPING
+        if mcc_range_category is None:
+            mcc_range_category = classify_mcc(mcc)
+        if mcc_range_category != MCC_CATEGORY_MAPPING['default']:
+            return mcc_range_category
         
         # Partner-based rules
         clean_desc = self.clean_text(description)
@@ -81,19 +99,7 @@ class SpendClassifier:
                     return partner_info['category']
         
         # Keyword-based rules
-        keyword_rules = {
-            'Travel': ['vietjet', 'vietnam airlines', 'bamboo airways', 'flight', 'airline', 'airport', 'ticket'],
-            'Accommodation': ['hotel', 'resort', 'motel', 'homestay', 'airbnb', 'booking', 'lodge'],
-            'F&B': ['restaurant', 'cafe', 'coffee', 'food', 'eat', 'drink', 'pizza', 'burger', 'pho', 'com'],
-            'Transportation': ['taxi', 'grab', 'uber', 'bus', 'train', 'fuel', 'gas', 'petrol', 'parking'],
-            'Shopping': ['shop', 'store', 'mall', 'market', 'buy', 'purchase', 'retail', 'clothing'],
-            'Entertainment': ['movie', 'cinema', 'game', 'sport', 'gym', 'music', 'concert', 'club'],
-            'Healthcare': ['hospital', 'clinic', 'doctor', 'pharmacy', 'medical', 'health', 'drug'],
-            'Education': ['school', 'university', 'course', 'book', 'tuition', 'education', 'learn'],
-            'Banking': ['bank', 'atm', 'transfer', 'loan', 'insurance', 'credit', 'finance']
-        }
-        
-        for category, keywords in keyword_rules.items():
+        for category, keywords in KEYWORD_RULES:
             for keyword in keywords:
                 if keyword in combined_text:
                     return category
@@ -230,35 +236,66 @@ class SpendClassifier:
         
         # Fallback to ML
         combined_text = self.clean_text(description) + ' ' + self.clean_text(merchant_name)
-        ml_pred = self.ml_pipeline.predict([combined_text])[0]
+        # One predict_proba pass; the label is the argmax column (predict() would re-run TF-IDF)
         ml_proba = self.ml_pipeline.predict_proba([combined_text])[0]
-        
-        # Get confidence (max probability)
-        confidence = float(np.max(ml_proba))
+        best = int(ml_proba.argmax())
         
         return {
-            'category': ml_pred,
-            'confidence': confidence,
+            'category': self.ml_pipeline.classes_[best],
+            'confidence': float(ml_proba[best]),  # Get confidence (max probability)
             'method': 'ml-based',
-            'all_probabilities': {
-                cat: float(prob) for cat, prob in zip(self.categories, ml_proba)
-            }
+            'all_probabilities': dict(zip(self.categories, ml_proba.tolist()))
         }
     
-    def predict_batch(self, df: pd.DataFrame) -> List[Dict]:
-        """Predict categories for a batch of transactions"""
-        predictions = []
+    def predict_many(self, descriptions: List[str], mccs: List[str], merchant_names: List[str]) -> List[Dict]:
+        """Predict categories for parallel lists of fields, one ML call for all rule misses"""
+        if not self.is_trained:
+            raise ValueError("Model not trained yet!")
         
-        for _, row in df.iterrows():
-            pred = self.predict(
-                row.get('description', ''),
-                row.get('mcc', ''),
-                row.get('merchant_name', '')
-            )
-            predictions.append(pred)
+        predictions: List[Optional[Dict]] = [None] * len(descriptions)
+        ml_indices = []
+        ml_texts = []
+        
+        # Try rules first; the MCC range lookup runs once for the whole column
+        from config import classify_mcc
+        mcc_ranges = classify_mcc(np.asarray(mccs, dtype=object))
+        for i, (description, mcc, merchant_name) in enumerate(zip(descriptions, mccs, merchant_names)):
+            rule_pred = self.apply_rules(description, mcc, merchant_name, mcc_ranges[i])
+            if rule_pred:
+                predictions[i] = {
+                    'category': rule_pred,
+                    'confidence': 0.95,  # High confidence for rule-based
+                    'method': 'rule-based'
+                }
+            else:
+                ml_indices.append(i)
+                ml_texts.append(self.clean_text(description) + ' ' + self.clean_text(merchant_name))
+        
+        # Fallback to ML for the remaining rows in a single vectorized call
+        if ml_texts:
+            ml_proba = self.ml_pipeline.predict_proba(ml_texts)
+            best = ml_proba.argmax(axis=1)
+            ml_pred = self.ml_pipeline.classes_[best]
+            confidences = ml_proba[np.arange(len(best)), best].tolist()
+            
+            # Convert the matrix to Python floats once instead of float() per cell
+            for i, pred, confidence, proba in zip(ml_indices, ml_pred, confidences, ml_proba.tolist()):
+                predictions[i] = {
+                    'category': pred,
+                    'confidence': confidence,
+                    'method': 'ml-based',
+                    'all_probabilities': dict(zip(self.categories, proba))
+                }
         
         return predictions
     
+    def predict_batch(self, df: pd.DataFrame) -> List[Dict]:
+        """Predict categories for a batch of transactions"""
+        def column(name: str) -> List:
+            return df[name].tolist() if name in df.columns else [''] * len(df)
+        
+        return self.predict_many(column('description'), column('mcc'), column('merchant_name'))
+    
     def save_model(self, model_path: Path):
         """Save the trained model"""
         if not self.is_trained:
@@ -275,9 +312,9 @@ class SpendClassifier:
         joblib.dump(model_data, model_path)
         print(f"✅ Model saved to {model_path}")
     
-    def load_model(self, model_path: Path):
-        """Load a trained model"""
-        model_data = joblib.load(model_path)
+    def load_model(self, model_path: Path, mmap_mode: Optional[str] = None):
+        """Load a trained model (mmap_mode='r' memory-maps the numpy weight arrays)"""
+        model_data = joblib.load(model_path, mmap_mode=mmap_mode)
         
         self.ml_pipeline = model_data['ml_pipeline']
         self.mcc_mapping = model_data['mcc_mapping']
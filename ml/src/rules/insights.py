@@ -14,6 +14,9 @@ class InsightsEngine:
     Rules-based engine for generating financial insights
     """
     
+    # Columns the stats/insights computations read
+    INPUT_COLUMNS = ('user_id', 'transaction_date', 'amount', 'category', 'is_weekend')
+    
     def __init__(self, rules_config: Optional[Dict] = None):
         self.rules_config = rules_config or {}
         self.insights_rules = {}
@@ -121,27 +124,38 @@ class InsightsEngine:
             }
         }
     
-    def calculate_spending_stats(self, transactions_df: pd.DataFrame, user_id: str = None) -> Dict:
-        """Calculate comprehensive spending statistics"""
+    def _prepare_user_frame(self, transactions_df: pd.DataFrame, user_id: str = None) -> pd.DataFrame:
+        """Filter to one user (if given) and coerce column types, once per request"""
         if user_id:
             df = transactions_df[transactions_df['user_id'] == user_id].copy()
         else:
             df = transactions_df.copy()
         
         if len(df) == 0:
-            return {}
+            return df
         
         # Convert types
         df['amount'] = pd.to_numeric(df['amount'])
         df['transaction_date'] = pd.to_datetime(df['transaction_date'])
         df['is_weekend'] = pd.to_numeric(df.get('is_weekend', 0))
+        return df
+    
+    def calculate_spending_stats(self, transactions_df: pd.DataFrame, user_id: str = None) -> Dict:
+        """Calculate comprehensive spending statistics"""
+        return self._compute_spending_stats(self._prepare_user_frame(transactions_df, user_id))
+    
+    def _compute_spending_stats(self, df: pd.DataFrame) -> Dict:
+        """Calculate spending statistics from an already filtered, typed frame"""
+        if len(df) == 0:
+            return {}
         
-        # Time-based analysis
-        current_month = df['transaction_date'].max().to_period('M')
-        current_month_data = df[df['transaction_date'].dt.to_period('M') == current_month]
+        # Time-based analysis (month periods derived once)
+        months = df['transaction_date'].dt.to_period('M')
+        current_month = months.max()
+        current_month_data = df[months == current_month]
         
         # Monthly analysis
-        monthly_stats = df.groupby(df['transaction_date'].dt.to_period('M'))['amount'].agg(['sum', 'count']).reset_index()
+        monthly_stats = df.groupby(months)['amount'].agg(['sum', 'count']).reset_index()
         monthly_stats.columns = ['month', 'total_amount', 'transaction_count']
         
         # Calculate basic stats
@@ -153,16 +167,18 @@ class InsightsEngine:
         current_month_amount = current_month_data['amount'].sum()
         current_month_transactions = len(current_month_data)
         
-        # Category analysis
-        category_stats = df.groupby('category')['amount'].agg(['sum', 'count', 'mean']).reset_index()
-        category_percentages = {}
-        category_amounts = {}
-        
-        for _, row in category_stats.iterrows():
-            category = row['category']
-            amount = row['sum']
-            category_amounts[category] = amount
-            category_percentages[category] = (amount / total_amount) * 100 if total_amount > 0 else 0
+        # Category analysis: one groupby feeds every per-category stat below
+        category_stats = df.groupby('category').agg(
+            sum=('amount', 'sum'),
+            count=('amount', 'count'),
+            mean=('amount', 'mean'),
+            weekend_ratio=('is_weekend', 'mean'),
+        )
+        category_amounts = category_stats['sum'].to_dict()
+        if total_amount > 0:
+            category_percentages = (category_stats['sum'] / total_amount * 100).to_dict()
+        else:
+            category_percentages = dict.fromkeys(category_amounts, 0)
         
         # Find dominant category
         dominant_category = max(category_percentages.keys(), key=lambda x: category_percentages[x]) if category_percentages else "Unknown"
@@ -175,18 +191,13 @@ class InsightsEngine:
         # F&B specific stats
         fb_amount = category_amounts.get('F&B', 0)
         fb_percentage = category_percentages.get('F&B', 0)
-        fb_transactions = len(df[df['category'] == 'F&B'])
+        fb_transactions = int(category_stats['count'].get('F&B', 0))
         
         # Accommodation stats
-        accommodation_data = df[df['category'] == 'Accommodation']
-        accommodation_avg = accommodation_data['amount'].mean() if len(accommodation_data) > 0 else 0
+        accommodation_avg = category_stats['mean'].get('Accommodation', 0)
         
         # Entertainment weekend ratio
-        entertainment_data = df[df['category'] == 'Entertainment']
-        if len(entertainment_data) > 0:
-            entertainment_weekend_ratio = entertainment_data['is_weekend'].mean()
-        else:
-            entertainment_weekend_ratio = 0
+        entertainment_weekend_ratio = category_stats['weekend_ratio'].get('Entertainment', 0)
         
         # Spending volatility (coefficient of variation)
         if len(monthly_stats) > 1:
@@ -242,8 +253,10 @@ class InsightsEngine:
     
     def generate_insights(self, transactions_df: pd.DataFrame, user_id: str = None) -> List[Dict]:
         """Generate insights for a user"""
-        stats = self.calculate_spending_stats(transactions_df, user_id)
-        
+        return self._insights_from_stats(self.calculate_spending_stats(transactions_df, user_id), user_id)
+    
+    def _insights_from_stats(self, stats: Dict, user_id: str = None) -> List[Dict]:
+        """Evaluate insight rules against precomputed spending stats"""
         if not stats:
             return []
         
@@ -305,17 +318,10 @@ class InsightsEngine:
     
     def get_spending_summary(self, transactions_df: pd.DataFrame, user_id: str = None) -> Dict:
         """Get comprehensive spending summary"""
-        stats = self.calculate_spending_stats(transactions_df, user_id)
-        insights = self.generate_insights(transactions_df, user_id)
-        
-        # Create spending trends
-        if user_id:
-            df = transactions_df[transactions_df['user_id'] == user_id].copy()
-        else:
-            df = transactions_df.copy()
-        
-        df['amount'] = pd.to_numeric(df['amount'])
-        df['transaction_date'] = pd.to_datetime(df['transaction_date'])
+        # Filter and type-convert once; stats, insights and trends share the frame
+        df = self._prepare_user_frame(transactions_df, user_id)
+        stats = self._compute_spending_stats(df)
+        insights = self._insights_from_stats(stats, user_id)
         
         # Monthly trend
         monthly_trend = df.groupby(df['transaction_date'].dt.to_period('M'))['amount'].sum().to_dict()